@@ -0,0 +1,1133 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import shutil
+import tempfile
+import tracemalloc
+import numpy as np
+import cv2
+from timeit import default_timer as timer
+
+from parser import *
+from box import *
+from region import *
+from chain import *
+from template import *
+from knn import *
+from svm import *
+from pipeline import *
+
+
+DIR_TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+def mser_point_sets(img_gray, min_area=45, max_area=2000, delta=20):
+    """
+    Calculate the MSER point sets and boxes of an image, as per `task_1.py`.
+
+    Parameters
+    ----------
+    img_gray : 2-D array of int
+        Grayscale image.
+    min_area : int, default=45
+    max_area : int, default=2000
+    delta : int, default=20
+
+    Returns
+    -------
+    point_sets : list of 2-D array of int32
+    boxes : 2-D array of int32
+
+    """
+    mser = cv2.MSER_create()
+    mser.setMinArea(min_area)
+    mser.setMaxArea(max_area)
+    mser.setDelta(delta)
+    point_sets, boxes = mser.detectRegions(img_gray)
+    return point_sets, boxes
+
+
+def image_files(dir_input):
+    """
+    List the image files of a directory, sorted by name.
+
+    Parameters
+    ----------
+    dir_input : string
+
+    Returns
+    -------
+    list of string
+
+    """
+    return sorted(
+        [os.path.join(dir_input, f)
+         for f in os.listdir(dir_input)
+         if os.path.splitext(f)[1] in {".jpg", ".png"}])
+
+
+def timed(func, *func_args):
+    """
+    Measure the wall time of a function call.
+
+    Parameters
+    ----------
+    func : callable
+    func_args : arguments passed to `func`
+
+    Returns
+    -------
+    result : X, where X is the return type of `func`
+    time : float
+        Wall time of the call, in seconds.
+
+    """
+    time_start = timer()
+    result = func(*func_args)
+    time = timer() - time_start
+    return result, time
+
+
+def measure(func, *func_args):
+    """
+    Measure the wall time and traced memory of a function call.
+
+    Parameters
+    ----------
+    func : callable
+    func_args : arguments passed to `func`
+
+    Returns
+    -------
+    result : X, where X is the return type of `func`
+    time : float
+        Wall time of the call, in seconds.
+    memory : int
+        Traced memory, in bytes, still allocated once the call has returned;
+        that is, the memory held by `result`.
+    peak : int
+        Peak traced memory, in bytes, during the call.
+
+    """
+    tracemalloc.start()
+    time_start = timer()
+    result = func(*func_args)
+    time = timer() - time_start
+    memory, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, time, memory, peak
+
+
+def legacy_regions(point_sets):
+    """
+    Construct regions as a set of point tuples and a bounding box.
+
+    This is the representation `Region` used before it was backed by arrays,
+    and is kept only as a reference for benchmarking.
+
+    """
+    regions = []
+    for ps in point_sets:
+        points = set([(p[0], p[1]) for p in ps])
+        regions.append((points, bounding_box(points)))
+    return regions
+
+
+def synthetic_regions(n, seed=0):
+    """
+    Construct random regions, with nested sub-regions as produced by MSER.
+
+    The canvas grows with `n`, so that the density of regions is constant.
+
+    Parameters
+    ----------
+    n : int
+        Number of regions.
+    seed : int, default=0
+
+    Returns
+    -------
+    regions : list of Region
+
+    """
+    rng = np.random.default_rng(seed)
+    side = int(40 * np.sqrt(n))
+
+    regions = []
+    while len(regions) < n:
+        w, h = rng.integers(5, 40, size=2)
+        x, y = rng.integers(0, side - 40, size=2)
+        ys, xs = np.nonzero(rng.random((h, w)) < 0.8)
+        coords = np.stack([xs + x, ys + y], axis=1)
+        regions.append(Region(coords))
+
+        if len(regions) < n and rng.random() < 0.5:
+            keep = rng.random(len(coords)) < rng.uniform(0.6, 1.0)
+            keep[0] = True
+            regions.append(Region(coords[keep]))
+    return regions
+
+
+def legacy_remove_overlapping(regions, max_overlap=0.8):
+    """
+    Filter regions as per `remove_overlapping()`, by comparing every region
+    against all retained regions.
+
+    This is how `remove_overlapping()` worked before it used a `BoxIndex`, and
+    is kept only as a reference for benchmarking.
+
+    """
+    regions_ordered = sorted(regions, key=lambda r: r.area, reverse=True)
+    regions_filtered = []
+    for r in regions_ordered:
+        if np.all([not (rf.box.is_superset_of(r.box)
+                        and rf.overlap(r) >= max_overlap)
+                   for rf in regions_filtered]):
+            regions_filtered.append(r)
+    return regions_filtered
+
+
+def benchmark_overlapping(args):
+    """
+    Compare `remove_overlapping()` against all-pairs scanning, on synthetic
+    sets of 100 to 10,000 regions.
+
+    """
+    print(f"{'regions':>8} {'retained':>9} {'pairwise s':>11} "
+          f"{'indexed s':>10} {'same':>5}")
+    for n in [100, 300, 1000, 3000, 10000]:
+        regions = synthetic_regions(n)
+
+        legacy, time_l = timed(legacy_remove_overlapping, regions)
+        indexed, time_i = timed(remove_overlapping, regions)
+
+        same = (len(legacy) == len(indexed)
+                and all([rl is ri for rl, ri in zip(legacy, indexed)]))
+        print(f"{n:>8} {len(indexed):>9} {time_l:>11.3f} "
+              f"{time_i:>10.3f} {str(same):>5}")
+    return
+
+
+def benchmark_regions(args):
+    """
+    Compare construction time and memory of `Region` against the legacy
+    set-of-tuples representation, on the MSER regions of each input image.
+
+    """
+    print(f"{'image':<12} {'regions':>8} "
+          f"{'legacy s':>9} {'legacy MiB':>11} "
+          f"{'region s':>9} {'region MiB':>11}")
+    for img_file in image_files(args["input"]):
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        point_sets, _ = mser_point_sets(img_gray)
+
+        _, time_l, memory_l, _ = measure(legacy_regions, point_sets)
+        _, time_r, memory_r, _ = measure(
+            lambda pss: [Region(ps) for ps in pss], point_sets)
+
+        file_root, _, _ = parse_image_file(img_file)
+        print(f"{file_root:<12} {len(point_sets):>8} "
+              f"{time_l:>9.3f} {memory_l / 2**20:>11.2f} "
+              f"{time_r:>9.3f} {memory_r / 2**20:>11.2f}")
+    return
+
+
+def benchmark_lazy(args):
+    """
+    Report the per-region memory overhead of `Region` on the input images with
+    the most MSER regions, as it is constructed lazily, once its mask and area
+    are calculated (as was done eagerly upon construction), and once its point
+    set, contours and boundary are calculated.
+
+    """
+    point_sets = dict()
+    for img_file in image_files(args["input"]):
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        point_sets[img_file] = mser_point_sets(img_gray)
+    largest = sorted(
+        point_sets, key=lambda f: len(point_sets[f][0]), reverse=True)[:3]
+
+    print(f"{'image':<12} {'regions':>8} {'lazy B':>8} "
+          f"{'masked B':>9} {'full B':>9}")
+    for img_file in largest:
+        pss, boxes = point_sets[img_file]
+        n = len(pss)
+
+        tracemalloc.start()
+        regions = mser_regions(pss, boxes)
+        memory_lazy, _ = tracemalloc.get_traced_memory()
+        for r in regions:
+            r.area
+        memory_masked, _ = tracemalloc.get_traced_memory()
+        for r in regions:
+            r.points
+            r.boundary
+        memory_full, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        file_root, _, _ = parse_image_file(img_file)
+        print(f"{file_root:<12} {n:>8} {memory_lazy / n:>8.0f} "
+              f"{memory_masked / n:>9.0f} {memory_full / n:>9.0f}")
+    return
+
+
+def legacy_merge_overlapping(boxes, max_overlap=0.05):
+    """
+    Merge boxes as per `merge_overlapping()`, by recursively rebuilding the
+    list of merged boxes upon every merge.
+
+    This is how `merge_overlapping()` worked before it used a `BoxIndex`, and
+    is kept only as a reference for benchmarking.
+
+    """
+    def overlaps(bi, bj):
+        return (bi.overlap(bj) >= max_overlap
+                or bj.overlap(bi) >= max_overlap)
+
+    def merge_into(boxes, box):
+        overlapping = [b for b in boxes if overlaps(box, b)]
+        if (len(overlapping) == 0):
+            return (boxes + [box])
+        else:
+            preserved = [b for b in boxes if not overlaps(box, b)]
+            merged = covering_box(overlapping + [box])
+            return (merge_into(preserved, merged))
+
+    boxes_merged = []
+    for b in boxes:
+        boxes_merged = merge_into(boxes_merged, b)
+    return boxes_merged
+
+
+def chain_rois(dir_inputs):
+    """
+    Collect the boxes of all chains found in the input images, as regions of
+    interest would be in `task_1.py` and `task_2.py`.
+
+    The chains are found without filtering edges, so that every path through
+    the linked regions is a chain.
+
+    Parameters
+    ----------
+    dir_inputs : list of string
+
+    Returns
+    -------
+    rois : list of Box
+
+    """
+    rois = []
+    for img_file in [f for d in dir_inputs for f in image_files(d)]:
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        regions = remove_overlapping(mser_regions(*mser_point_sets(img_gray)))
+        regions = [r for r in regions if 0.75 <= r.box.aspect <= 3.0]
+        rois += [covering_box([r.box for r in c])
+                 for c in find_chains(regions, best_edge=False)]
+    return rois
+
+
+def synthetic_rois(n, seed=0):
+    """
+    Construct random boxes shaped like chains of digits, at constant density.
+
+    Parameters
+    ----------
+    n : int
+        Number of boxes.
+    seed : int, default=0
+
+    Returns
+    -------
+    rois : list of Box
+
+    """
+    rng = np.random.default_rng(seed)
+    side = int(160 * np.sqrt(n))
+    heights = rng.integers(10, 40, size=n)
+    widths = heights * rng.integers(2, 5, size=n)
+    xs = rng.integers(0, side, size=n)
+    ys = rng.integers(0, side, size=n)
+    return [Box(*b) for b in zip(xs.tolist(), ys.tolist(),
+                                 widths.tolist(), heights.tolist())]
+
+
+def benchmark_merge(args):
+    """
+    Stress `merge_overlapping()` against the recursive merge, on the pooled
+    chain boxes of the training images, and on up to 10,000 synthetic boxes.
+
+    """
+    dir_train = os.path.join(DIR_TOP, "train")
+    rois_sets = [
+        ("chains", chain_rois([os.path.join(dir_train, "task1"),
+                               os.path.join(dir_train, "task2")]))]
+    rois_sets += [("synthetic", synthetic_rois(n))
+                  for n in [1000, 3000, 10000]]
+
+    print(f"{'rois':<10} {'boxes':>6} {'merged':>7} {'recursive s':>12} "
+          f"{'indexed s':>10} {'same':>5}")
+    for name, rois in rois_sets:
+        merged, time_i = timed(merge_overlapping, rois, 0.01)
+        if len(rois) > 3000:
+            # the recursive merge is quadratic, and takes many minutes on these
+            time_l, same = ("skipped", "-")
+        else:
+            try:
+                legacy, time_l = timed(legacy_merge_overlapping, rois, 0.01)
+                same = ([(b.x, b.y, b.width, b.height) for b in legacy]
+                        == [(b.x, b.y, b.width, b.height) for b in merged])
+                time_l = f"{time_l:.3f}"
+            except RecursionError:
+                time_l, same = ("recursion", "-")
+        print(f"{name:<10} {len(rois):>6} {len(merged):>7} {time_l:>12} "
+              f"{time_i:>10.3f} {str(same):>5}")
+    return
+
+
+def legacy_find_chains(regions, best_edge=True):
+    """
+    Find chains as per `find_chains()`, by evaluating the links between all
+    pairs of regions as a single matrix.
+
+    This is how `find_chains()` worked before it searched for candidate links
+    in a window of the regions sorted by `x`, and is kept only as a reference
+    for benchmarking.
+
+    """
+    regions_ordered = sorted(regions, key=lambda r: r.box.x)
+    n = len(regions_ordered)
+
+    boxes = BoxArray.from_boxes([r.box for r in regions_ordered])
+    links_all = linked_matrix(boxes, boxes)
+
+    edges = dict()
+    roots = set(range(0, n))
+    for i in range(n):
+        ri = regions_ordered[i]
+
+        links = set((np.flatnonzero(links_all[i, i+1:]) + i + 1).tolist())
+        if best_edge and links:
+            links_listed = list(links)
+            distances = ri.distances(
+                [regions_ordered[j].box.center for j in links_listed])
+            links = {links_listed[np.argmin(distances)]}
+
+        edges[i] = links
+        roots -= edges[i]
+        if not edges[i]:
+            roots -= {i}
+
+    def paths(i):
+        if edges[i]:
+            suffixes = [p for j in edges[i] for p in paths(j)]
+            return [[i] + s for s in suffixes]
+        else:
+            return [[i]]
+
+    chains = [p for i in roots for p in paths(i)]
+    return [list(map(lambda i: regions_ordered[i], c)) for c in chains]
+
+
+def benchmark_chains(args):
+    """
+    Compare `find_chains()` against linking all pairs of regions, on the
+    filtered MSER regions of the input images, and on synthetic sets of 300 to
+    30,000 regions.
+
+    """
+    regions_sets = []
+    for img_file in image_files(args["input"]):
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        regions = remove_overlapping(mser_regions(*mser_point_sets(img_gray)))
+        file_root, _, _ = parse_image_file(img_file)
+        regions_sets.append((file_root, regions))
+    regions_sets += [("synthetic", synthetic_regions(n))
+                     for n in [300, 1000, 3000, 10000, 30000]]
+
+    print(f"{'regions':<12} {'n':>6} {'chains':>7} {'pairwise s':>11} "
+          f"{'windowed s':>11} {'same':>5}")
+    for name, regions in regions_sets:
+        chains, time_w = timed(find_chains, regions)
+        if len(regions) > 3000:
+            # the link matrix of these takes gigabytes of memory
+            time_l, same = ("skipped", "-")
+        else:
+            legacy, time_l = timed(legacy_find_chains, regions)
+            same = ([[id(r) for r in c] for c in legacy]
+                    == [[id(r) for r in c] for c in chains])
+            time_l = f"{time_l:.3f}"
+        print(f"{name:<12} {len(regions):>6} {len(chains):>7} {time_l:>11} "
+              f"{time_w:>11.3f} {str(same):>5}")
+    return
+
+
+def legacy_otsu_separations(img, boxes):
+    """
+    Calculate the Otsu separations of a colour image restricted to each box,
+    twice over, as `cluster_largest_otsu_separations()` did before it used an
+    `OtsuContext`, converting the whole image to grayscale upon every call.
+
+    This is kept only as a reference for benchmarking.
+
+    """
+    def separation(box):
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return np.amin(
+            [otsu_separation(img_gray, box),
+             otsu_separation(img[:, :, 0], box),
+             otsu_separation(img[:, :, 1], box),
+             otsu_separation(img[:, :, 2], box)])
+
+    sorted(boxes, key=separation, reverse=True)
+    return [separation(box) for box in boxes]
+
+
+def context_otsu_separations(img, boxes):
+    """
+    Calculate the Otsu separations of a colour image restricted to each box,
+    twice over, through a single `OtsuContext`.
+
+    """
+    otsu = OtsuContext(img)
+    sorted(boxes, key=otsu.separation, reverse=True)
+    return [otsu.separation(box) for box in boxes]
+
+
+def benchmark_otsu(args):
+    """
+    Compare the Otsu separations of the chains of each input image, calculated
+    through an `OtsuContext`, against converting the image upon every call.
+
+    """
+    print(f"{'image':<12} {'chains':>7} {'per-call s':>11} {'context s':>10} "
+          f"{'same':>5}")
+    for img_file in image_files(args["input"]):
+        img = cv2.imread(img_file)
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        regions = remove_overlapping(mser_regions(*mser_point_sets(img_gray)))
+        boxes = [covering_box([r.box for r in c])
+                 for c in find_chains(regions, best_edge=False)]
+
+        legacy, time_l = timed(legacy_otsu_separations, img, boxes)
+        context, time_c = timed(context_otsu_separations, img, boxes)
+
+        file_root, _, _ = parse_image_file(img_file)
+        print(f"{file_root:<12} {len(boxes):>7} {time_l:>11.3f} "
+              f"{time_c:>10.3f} {str(legacy == context):>5}")
+    return
+
+
+def otsu_separations(img, img_gray, boxes, integral):
+    """
+    Calculate the Otsu separations of a colour image restricted to each box,
+    through a single `OtsuContext`.
+
+    """
+    return OtsuContext(img, img_gray, integral=integral).separations(boxes)
+
+
+def benchmark_histogram(args):
+    """
+    Compare the Otsu separations of the colour input images, restricted to 1000
+    random boxes of each size, calculated from integral histograms against
+    thresholding each box of each channel.
+
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'image':<12} {'size':>5} {'threshold s':>12} {'integral s':>11} "
+          f"{'same':>5}")
+    for img_file in image_files(args["input"])[:5]:
+        img = cv2.imread(img_file)
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        H, W = img_gray.shape[:2]
+        file_root, _, _ = parse_image_file(img_file)
+
+        for size in [16, 64, 256]:
+            xs = rng.integers(0, W - size, 1000).tolist()
+            ys = rng.integers(0, H - size // 2, 1000).tolist()
+            boxes = [Box(x, y, size, size // 2) for x, y in zip(xs, ys)]
+
+            seps_t, time_t = timed(
+                otsu_separations, img, img_gray, boxes, False)
+            seps_i, time_i = timed(
+                otsu_separations, img, img_gray, boxes, True)
+
+            same = np.array_equal(seps_t, seps_i, equal_nan=True)
+            print(f"{file_root:<12} {size:>5} {time_t:>12.3f} "
+                  f"{time_i:>11.3f} {str(same):>5}")
+    return
+
+
+def legacy_aligned(chain_1, chain_2):
+    """
+    Determine if two chains are aligned as per `aligned()`, one pair at a time.
+
+    This is how `aligned()` worked before the alignment of all pairs of chains
+    was calculated together, and is kept only as a reference for benchmarking.
+
+    """
+    n1 = len(chain_1)
+    n2 = len(chain_2)
+
+    if (not (2 <= n1 <= 3)) and (not (2 <= n2 <= 3)):
+        return False
+
+    norm = lambda p: np.sqrt(np.abs((p[0] ** 2) + (p[1] ** 2)))
+    diff = lambda p1, p2: (p1[0] - p2[0], p1[1] - p2[1])
+
+    box_1 = covering_box([r.box for r in chain_1])
+    box_2 = covering_box([r.box for r in chain_2])
+    w = min([box_1.width, box_2.width])
+
+    n = min([n1, n2])
+    digits_1 = {i: chain_1[n1-i-1] for i in range(n)}
+    digits_2 = {i: chain_2[n2-i-1] for i in range(n)}
+
+    aligned_vert = np.all(
+        [np.abs(diff(digits_1[i].box.center, digits_2[i].box.center)[0])
+         <= w
+         for i in range(n)])
+
+    similar_heights = np.all(
+        [np.abs(digits_1[i].box.height - digits_2[i].box.height)
+         <= 0.2 * min([digits_1[i].box.height, digits_2[i].box.height])
+         for i in range(n)])
+
+    return (aligned_vert and similar_heights)
+
+
+def legacy_find_aligned_chains(chains):
+    """
+    Find the largest subset of aligned chains as per `find_aligned_chains()`,
+    by comparing all ordered pairs of chains and searching the graph of chains
+    recursively.
+
+    This is how `find_aligned_chains()` worked before it used an alignment
+    matrix and union-find, and is kept only as a reference for benchmarking.
+
+    """
+    chains_ordered = sorted(
+        chains, key=lambda c: covering_box([r.box for r in c]).y)
+    n = len(chains_ordered)
+
+    edges = dict()
+    for i, ci in enumerate(chains_ordered[0:n]):
+        edges[i] = {j for j, cj in enumerate(chains_ordered)
+                    if (j != i and legacy_aligned(ci, cj))}
+
+    def dfs(explored, i):
+        idxs = {i}
+        if i not in explored:
+            explored |= {i}
+            for j in edges[i]:
+                idxs |= dfs(explored, j)
+        return idxs
+
+    k = 0
+    eq_classes = dict()
+    explored = set()
+    for i in range(n):
+        if i not in explored:
+            eq_classes[k] = dfs(explored, i)
+            k += 1
+
+    aligned_chains = [[chains_ordered[j]
+                       for j in eq_classes[k]]
+                      for k in eq_classes
+                      if len(eq_classes[k]) > 1]
+
+    return max(aligned_chains, key=lambda ac: len(ac))
+
+
+def synthetic_chains(n, seed=0):
+    """
+    Construct random chains of 1 to 4 digit-like regions, stacked in columns
+    of 1 to 7 chains, as the lines of a directory sign are.
+
+    Parameters
+    ----------
+    n : int
+        Number of chains.
+    seed : int, default=0
+
+    Returns
+    -------
+    chains : list of list of Region
+
+    """
+    rng = np.random.default_rng(seed)
+    side = int(200 * np.sqrt(n))
+
+    def digit(x, y, w, h):
+        return Region(np.array([[x, y], [x + w - 1, y + h - 1]]))
+
+    chains = []
+    while len(chains) < n:
+        x, y = rng.integers(0, side, size=2).tolist()
+        h = int(rng.integers(12, 40))
+        lines = int(rng.integers(1, 8))
+        for line in range(min(lines, n - len(chains))):
+            hl = h + int(rng.integers(-2, 3))
+            xl = x + int(rng.integers(-3, 4))
+            yl = y + line * 2 * h
+            chains.append(
+                [digit(xl + k * h, yl, (2 * hl) // 3, hl)
+                 for k in range(int(rng.integers(1, 5)))])
+    return chains
+
+
+def benchmark_aligned(args):
+    """
+    Compare `find_aligned_chains()` against comparing all ordered pairs of
+    chains, on synthetic sets of 30 to 1,000 chains.
+
+    """
+    print(f"{'chains':>7} {'aligned':>8} {'pairwise s':>11} {'matrix s':>9} "
+          f"{'same':>5}")
+    for n in [30, 100, 300, 1000]:
+        chains = synthetic_chains(n)
+
+        legacy, time_l = timed(legacy_find_aligned_chains, chains)
+        found, time_m = timed(find_aligned_chains, chains)
+
+        # the legacy chains are ordered by set iteration, so compare as sets
+        same = ({id(c) for c in legacy} == {id(c) for c in found})
+        print(f"{n:>7} {len(found):>8} {time_l:>11.3f} {time_m:>9.3f} "
+              f"{str(same):>5}")
+    return
+
+
+def legacy_find_missing_digits(aligned_chains, img_gray):
+    """
+    Find any missing left digits as per `find_missing_digits()`, one chain at a
+    time.
+
+    This is how `find_missing_digits()` worked before the connected components
+    of all chains were calculated together, and is kept only as a reference
+    for benchmarking.
+
+    """
+    H, W = img_gray.shape[:2]
+
+    aligned_chains_found = []
+    for chain in aligned_chains:
+        n = len(chain)
+
+        if n == 3:
+            aligned_chains_found.append(chain)
+            continue
+
+        digit_2 = chain[n-2]
+        digit_3 = chain[n-1]
+
+        box = covering_box([digit_2.box, digit_3.box])
+        diff_x = digit_3.box.tl[0] - digit_2.box.tl[0]
+        diff_y = digit_3.box.tl[1] - digit_2.box.tl[1]
+
+        x = max([0, box.tl[0] - int(0.9*diff_x)])
+        y = min([H - 1, max([0, box.tl[1] - diff_y])])
+        w = box.tl[0] - x - 1
+        h = min([H - y - 1, max([digit_2.box.height, digit_3.box.height])])
+        left_box = Box(x, y, w, h)
+
+        img_box = (img_gray[left_box.indexes]).astype(np.uint8)
+        t, img_bin = cv2.threshold(img_box, 128, 255, cv2.THRESH_OTSU)
+        regions = cc_regions(img_bin)
+
+        region = max(regions, key=lambda r: r.area)
+        digit_1 = Region({(x + p[0], y + p[1]) for p in region.points})
+
+        aligned_chains_found.append([digit_1, digit_2, digit_3])
+    return aligned_chains_found
+
+
+def sign_chains(img_gray):
+    """
+    Find the chains of at most 3 regions of a directional sign, as per
+    `task_2.py`.
+
+    Parameters
+    ----------
+    img_gray : 2-D array of int
+        Grayscale image.
+
+    Returns
+    -------
+    chains : list of list of Region
+
+    """
+    regions = remove_overlapping(
+        mser_regions(*mser_point_sets(img_gray, min_area=25)))
+    regions = [r for r in regions if 0.75 <= r.box.aspect <= 3.0]
+    regions = remove_occluded_holes(regions)
+    regions = [r for r in regions if r.fill <= 0.85]
+    return [c for c in iter_chains(regions) if len(c) <= 3]
+
+
+def benchmark_missing(args):
+    """
+    Compare `find_missing_digits()` against finding each digit from its own
+    connected components, on the aligned chains of the directional signs of
+    the input images, with the left digit of every chain removed.
+
+    """
+    print(f"{'image':<12} {'chains':>7} {'per-chain ms':>13} {'batch ms':>9} "
+          f"{'same':>5}")
+    for img_file in image_files(args["input"]):
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        aligned_chains = [c[-2:] for c in find_aligned_chains(
+            sign_chains(img_gray))]
+        if not aligned_chains:
+            continue
+
+        legacy, time_l = timed(
+            legacy_find_missing_digits, aligned_chains, img_gray)
+        found, time_b = timed(find_missing_digits, aligned_chains, img_gray)
+
+        same = all([np.array_equal(np.sort(rl.coords, axis=0),
+                                   np.sort(rf.coords, axis=0))
+                    for cl, cf in zip(legacy, found)
+                    for rl, rf in zip(cl, cf)])
+        file_root, _, _ = parse_image_file(img_file)
+        print(f"{file_root:<12} {len(aligned_chains):>7} "
+              f"{1000 * time_l:>13.2f} {1000 * time_b:>9.2f} {str(same):>5}")
+    return
+
+
+def legacy_find_arrows(aligned_chains, regions):
+    """
+    Find the arrows of each chain as per `find_arrows()`, by scanning all
+    regions for each chain.
+
+    This is how `find_arrows()` worked before it used a `BoxIndex`, and is kept
+    only as a reference for benchmarking.
+
+    """
+    aligned_chains_arrows = []
+    for chain in aligned_chains:
+        n = len(chain)
+
+        digit_2 = chain[n-2]
+        digit_3 = chain[n-1]
+
+        box = covering_box([digit_2.box, digit_3.box])
+        right_box = Box(box.tr[0] + 1, box.tr[1], box.width, box.height)
+
+        arrow = max(regions, key=lambda r: right_box.overlap(r.box))
+        aligned_chains_arrows.append((chain, arrow))
+    return aligned_chains_arrows
+
+
+def benchmark_arrows(args):
+    """
+    Compare `find_arrows()` against scanning all regions for each chain, on
+    synthetic sets of 300 to 10,000 regions, with a chain of a random region
+    for every tenth region.
+
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'regions':>8} {'chains':>7} {'scan s':>8} {'indexed s':>10} "
+          f"{'same':>5}")
+    for n in [300, 1000, 3000, 10000]:
+        regions = synthetic_regions(n)
+        chains = [[regions[i], regions[i]]
+                  for i in rng.integers(0, n, size=n // 10).tolist()]
+
+        legacy, time_l = timed(legacy_find_arrows, chains, regions)
+        indexed, time_i = timed(find_arrows, chains, regions)
+
+        same = all([al is ai for (_, al), (_, ai) in zip(legacy, indexed)])
+        print(f"{n:>8} {len(chains):>7} {time_l:>8.3f} {time_i:>10.3f} "
+              f"{str(same):>5}")
+    return
+
+
+def legacy_filter_regions(point_sets, boxes):
+    """
+    Construct and filter regions as per `task_1.py`, building the full list of
+    regions after each filter.
+
+    This is how `task_1.py` filtered regions before it used a `Pipeline`, and
+    is kept only as a reference for benchmarking.
+
+    """
+    regions = mser_regions(point_sets, boxes)
+    regions = remove_overlapping(regions, max_overlap=0.8)
+    regions = list(filter(lambda r: 1.2 <= r.box.aspect <= 3.0, regions))
+    regions = remove_occluded_holes(regions, max_boundary_distance=10)
+    regions = list(filter(lambda r: r.fill <= 0.85, regions))
+    return regions
+
+
+region_stages = Pipeline([
+    Stage("2_1", "removing overlapping regions",
+          lambda rs: remove_overlapping(rs, max_overlap=0.8), batch=True),
+    Stage("2_2", "filtering regions by aspect ratio",
+          lambda r: 1.2 <= r.box.aspect <= 3.0),
+    Stage("2_3", "removing occluded hole regions",
+          lambda rs: remove_occluded_holes(rs, max_boundary_distance=10),
+          batch=True),
+    Stage("2_4", "removing highly filled regions",
+          lambda r: r.fill <= 0.85)])
+
+
+def pipeline_first_region(point_sets, boxes):
+    """
+    Construct and filter regions as per `task_1.py`, through a `Pipeline`, up
+    to the first region to leave the pipeline.
+
+    """
+    regions = region_stages.run(mser_regions(point_sets, boxes))
+    return regions, next(regions, None)
+
+
+def benchmark_pipeline(args):
+    """
+    Compare the peak memory and time to the first filtered region of the
+    `Pipeline` of `task_1.py`, against building the full list of regions after
+    each filter, on each input image.
+
+    """
+    print(f"{'image':<12} {'regions':>8} {'lists MiB':>10} {'lists s':>8} "
+          f"{'stages MiB':>11} {'first s':>8} {'same':>5}")
+    for img_file in image_files(args["input"]):
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        point_sets, boxes = mser_point_sets(img_gray)
+
+        legacy, time_l, _, peak_l = measure(
+            legacy_filter_regions, point_sets, boxes)
+        (regions, first), time_f, _, peak_s = measure(
+            pipeline_first_region, point_sets, boxes)
+        regions = ([first] if first is not None else []) + list(regions)
+
+        same = ([r.coords.tobytes() for r in legacy]
+                == [r.coords.tobytes() for r in regions])
+        file_root, _, _ = parse_image_file(img_file)
+        print(f"{file_root:<12} {len(point_sets):>8} {peak_l / 2**20:>10.2f} "
+              f"{time_l:>8.3f} {peak_s / 2**20:>11.2f} {time_f:>8.3f} "
+              f"{str(same):>5}")
+    return
+
+
+def benchmark_templates(args):
+    """
+    Compare the time to build the KNN classifiers of `task_1.py` and
+    `task_2.py` from the template images, against storing their features in a
+    cache file, and against loading them from the warm cache file.
+
+    """
+    builders = [("digits 5x7", build_knn_digits, 5, 7),
+                ("digits 3x5", build_knn_digits, 3, 5),
+                ("arrows 2x2", build_knn_arrows, 2, 2)]
+
+    print(f"{'classifier':<12} {'cold s':>8} {'store s':>8} {'warm s':>8} "
+          f"{'same':>5}")
+    with tempfile.TemporaryDirectory() as dir_cache:
+        cache_file = os.path.join(dir_cache, "templates.pickle")
+        for name, build, bins_x, bins_y in builders:
+            knn_c, time_c = timed(build, args["digits"], bins_x, bins_y)
+            _, time_s = timed(
+                build, args["digits"], bins_x, bins_y, cache_file)
+            knn_w, time_w = timed(
+                build, args["digits"], bins_x, bins_y, cache_file)
+
+            samples = np.random.default_rng(0).random(
+                (1000, bins_x * bins_y), dtype=np.float32)
+            same = np.array_equal(knn_c.predict(samples),
+                                  knn_w.predict(samples))
+            print(f"{name:<12} {time_c:>8.4f} {time_s:>8.4f} {time_w:>8.4f} "
+                  f"{str(same):>5}")
+    return
+
+
+def benchmark_predict(args):
+    """
+    Compare the time per query of the "opencv" and "numpy" KNN backends, with
+    a call per chain, as per `task_2.py` before batching, and with a single
+    call for the chains of every input image.
+
+    """
+    features = []
+    for img_file in image_files(args["input"]):
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        features += [spatial_occupancies(c, 3, 5) for c in sign_chains(img_gray)]
+    n = sum(len(f) for f in features)
+
+    def per_chain(knn):
+        return np.concatenate([knn.predict(f, k=3) for f in features])
+
+    def batched(knn):
+        return np.concatenate(knn.predict_sets(features, k=3))
+
+    knns = {b: build_knn_digits(args["digits"], 3, 5, backend=b)
+            for b in ["opencv", "numpy"]}
+    reference = per_chain(knns["opencv"])
+
+    print(f"{len(features)} chains, {n} queries")
+    print(f"{'backend':<8} {'calls':<10} {'total s':>8} {'us/query':>9} "
+          f"{'same':>5}")
+    for backend, knn in knns.items():
+        for calls, predict in [("per chain", per_chain), ("batched", batched)]:
+            labels, time = timed(predict, knn)
+            same = np.array_equal(labels, reference)
+            print(f"{backend:<8} {calls:<10} {time:>8.4f} "
+                  f"{time / n * 1e6:>9.2f} {str(same):>5}")
+    return
+
+
+def jittered_templates(knn, n, sigma=0.05, seed=0):
+    """
+    Generate labelled training samples, by adding Gaussian noise to copies of
+    the training samples of a KNN object, as a stand-in for templates
+    harvested from real signs.
+
+    Parameters
+    ----------
+    knn : KNN
+    n : int
+        Number of training samples, in total.
+    sigma : float, default=0.05
+        Standard deviation of the noise, which is clipped to [0, 1].
+    seed : int, default=0
+
+    Returns
+    -------
+    samples_labelled : dict of (X, 2-D array of float32)
+
+    """
+    rng = np.random.default_rng(seed)
+    picks = np.arange(n) % knn.samples.shape[0]
+    samples = np.clip(knn.samples[picks]
+                      + rng.normal(0, sigma, (n, knn.samples.shape[1])), 0, 1)
+    return {knn.labels[k]: samples[knn.responses[picks] == k].astype(
+                np.float32)
+            for k in knn.labels}
+
+
+def benchmark_indexed(args):
+    """
+    Compare the time per query of the KNN backends, as the number of digit
+    templates grows, against the labels of the "opencv" backend, for the
+    digits of the chains of every input image.
+
+    """
+    features = []
+    for img_file in image_files(args["input"]):
+        img_gray = cv2.imread(img_file, cv2.IMREAD_GRAYSCALE)
+        features += [spatial_occupancies(c, 3, 5) for c in sign_chains(img_gray)]
+    samples = np.concatenate(features)
+
+    knn_digits = build_knn_digits(args["digits"], 3, 5)
+    backends = [("opencv", None), ("numpy", None), ("kdtree", None),
+                ("kdtree", 256), ("kdtree", 32)]
+
+    print(f"{samples.shape[0]} queries")
+    print(f"{'templates':>9} {'backend':<8} {'checks':>6} {'build s':>8} "
+          f"{'us/query':>9} {'agree':>6}")
+    for n in [50, 500, 5000, 50000, 100000]:
+        samples_labelled = jittered_templates(knn_digits, n)
+        reference = None
+        for backend, checks in backends:
+            knn, time_b = timed(KNN, samples_labelled, backend, checks)
+            labels, time_q = timed(knn.predict, samples, 3)
+            if reference is None:
+                reference = labels
+
+            agree = np.mean(labels == reference)
+            print(f"{n:>9} {backend:<8} {str(checks):>6} {time_b:>8.4f} "
+                  f"{time_q / samples.shape[0] * 1e6:>9.2f} {agree:>6.3f}")
+    return
+
+
+def benchmark_loading(args):
+    """
+    Compare the time to load the digit and arrow templates against the number
+    of worker threads, for the templates provided, and for copies of them with
+    `copies` images per label.
+
+    """
+    names = dict(template_names_digits, **template_names_arrows)
+    print(f"{os.cpu_count()} processors")
+    print(f"{'images':>7} {'workers':>7} {'total s':>8} {'same':>5}")
+    with tempfile.TemporaryDirectory() as dir_copies:
+        files = template_files(args["digits"], names)
+        for l in names:
+            for k in range(args["copies"]):
+                shutil.copy(files[l][k % len(files[l])], os.path.join(
+                    dir_copies, f"{names[l]}{k+1}.jpg"))
+
+        for dir_templates in [args["digits"], dir_copies]:
+            n = sum(len(f) for f in template_files(dir_templates, names).values())
+            reference = None
+            for workers in [1, 2, 4, 8]:
+                samples, time = timed(
+                    load_templates, dir_templates, names, 3, 5, None, workers)
+                if reference is None:
+                    reference = samples
+
+                same = all(np.array_equal(samples[l], reference[l])
+                           for l in names)
+                print(f"{n:>7} {workers:>7} {time:>8.4f} {str(same):>5}")
+    return
+
+
+def benchmark_svm(args):
+    """
+    Compare the wall time to train the one-vs-one digit SVMs against the number
+    of worker processes, for the default grid of C and for a limited grid.
+
+    """
+    samples = load_templates(args["digits"], template_names_digits, 5, 7)
+    queries = np.random.default_rng(0).random((1000, 35), dtype=np.float32)
+
+    print(f"{os.cpu_count()} processors")
+    print(f"{'C grid':<14} {'workers':>7} {'total s':>8} {'same':>5}")
+    for c_grid in [None, (1, 10, 10)]:
+        reference = None
+        for workers in [1, 2, 4, 8]:
+            svm, time = timed(SVM_OVO, samples, workers, c_grid)
+            labels = svm.predict(queries)
+            if reference is None:
+                reference = labels
+
+            same = np.array_equal(labels, reference)
+            print(f"{str(c_grid):<14} {workers:>7} {time:>8.3f} "
+                  f"{str(same):>5}")
+    return
+
+
+benchmarks = {
+    "regions": benchmark_regions,
+    "overlapping": benchmark_overlapping,
+    "lazy": benchmark_lazy,
+    "merge": benchmark_merge,
+    "chains": benchmark_chains,
+    "otsu": benchmark_otsu,
+    "histogram": benchmark_histogram,
+    "aligned": benchmark_aligned,
+    "missing": benchmark_missing,
+    "arrows": benchmark_arrows,
+    "pipeline": benchmark_pipeline,
+    "predict": benchmark_predict,
+    "indexed": benchmark_indexed,
+    "loading": benchmark_loading,
+    "svm": benchmark_svm,
+    "templates": benchmark_templates}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=sorted(benchmarks.keys()),
+                        help="benchmark to run")
+    parser.add_argument("-i", "--input",
+                        default=os.path.join(DIR_TOP, "train", "task1"),
+                        help="directory path with input images")
+    parser.add_argument("-d", "--digits",
+                        default=os.path.join(DIR_TOP, "train", "digits"),
+                        help="directory path with digit and arrow templates")
+    parser.add_argument("-c", "--copies", type=int, default=50,
+                        help="number of template copies per label")
+    args = vars(parser.parse_args())
+
+    benchmarks[args["benchmark"]](args)
@@ -147,24 +147,267 @@ class Box:
         return properties
 
 
+class BoxIndex:
+    """
+    Spatial index of boxes, on a uniform grid of square cells.
+
+    Each box is registered in every cell that it touches, so that a query only
+    needs to consider the boxes registered in the cells it touches.
+
+    Attributes
+    ----------
+    cell_size : int
+        Side length of the square cells of the grid.
+
+    boxes : list of Box
+        The boxes in the index, in order of insertion.
+        The key of a box is its position in this list, and removed boxes are
+        left as None.
+
+    cells : dict of ((int, int), list of int)
+        Map between the grid coordinates of a cell, and the keys of the boxes
+        registered in that cell.
+
+    Methods
+    -------
+    insert(box) : int
+        Inserts `box` into the index, and returns its key.
+
+    remove(key) :
+        Removes the box with key `key` from the index.
+
+    supersets_of(box) : list of int
+        Returns the sorted keys of all boxes in the index which are supersets of
+        `box`.
+
+    intersecting(box) : list of int
+        Returns the sorted keys of all boxes in the index which have a non-empty
+        intersection with `box`.
+
+    """
+
+    def __init__(self, boxes=None, cell_size=32):
+        self._cell_size = cell_size
+        self._boxes = []
+        self._cells = dict()
+        self._size = 0
+        if boxes:
+            for b in boxes:
+                self.insert(b)
+        return
+
+    @property
+    def cell_size(self):
+        return self._cell_size
+
+    @property
+    def boxes(self):
+        return self._boxes
+
+    @property
+    def cells(self):
+        return self._cells
+
+    def _cell_range(self, box):
+        s = self.cell_size
+        return (range(box.x // s, (box.x + box.width) // s + 1),
+                range(box.y // s, (box.y + box.height) // s + 1))
+
+    def insert(self, box):
+        key = len(self.boxes)
+        self._boxes.append(box)
+        self._size += 1
+        cells_x, cells_y = self._cell_range(box)
+        for i in cells_x:
+            for j in cells_y:
+                self._cells.setdefault((i, j), []).append(key)
+        return key
+
+    def remove(self, key):
+        cells_x, cells_y = self._cell_range(self.boxes[key])
+        for i in cells_x:
+            for j in cells_y:
+                self._cells[(i, j)].remove(key)
+        self._boxes[key] = None
+        self._size -= 1
+        return
+
+    def supersets_of(self, box):
+        # any superset of `box` contains its top-left corner
+        cell = (box.x // self.cell_size, box.y // self.cell_size)
+        return [k for k in self.cells.get(cell, [])
+                if self.boxes[k].is_superset_of(box)]
+
+    def intersecting(self, box):
+        cells_x, cells_y = self._cell_range(box)
+        keys = {k for i in cells_x for j in cells_y
+                for k in self.cells.get((i, j), [])}
+        return sorted([k for k in keys if self.boxes[k].overlap(box) > 0])
+
+    def __len__(self):
+        return self._size
+
+
+class BoxArray:
+    """
+    Collection of rectangular boxes, stored as columns of NumPy arrays.
+
+    Attributes
+    ----------
+    x : 1-D array of int
+        x-coordinates of the top-left corners of the boxes.
+    y : 1-D array of int
+        y-coordinates of the top-left corners of the boxes.
+    width : 1-D array of int
+        x-lengths of the boxes.
+    height : 1-D array of int
+        y-lengths of the boxes.
+
+    Methods
+    -------
+    from_boxes(boxes) : BoxArray
+        Constructs a box array from an iterable collection of Box.
+
+    to_boxes() : list of Box
+        Converts this box array to a list of Box.
+
+    right : 1-D array of int
+        x-coordinates of the bottom-right corners of the boxes.
+
+    bottom : 1-D array of int
+        y-coordinates of the bottom-right corners of the boxes.
+
+    center_x : 1-D array of int
+        x-coordinates of the geometric centers of the boxes, as per `Box`.
+
+    center_y : 1-D array of int
+        y-coordinates of the geometric centers of the boxes, as per `Box`.
+
+    area : 1-D array of int
+        Rectangular areas of the boxes.
+
+    overlap(boxes=None) : 2-D array of float
+        Matrix with entry `[i, j]` being `self[i].overlap(boxes[j])`.
+        Compares this box array against itself if `boxes` is not provided.
+
+    is_superset_of(boxes=None) : 2-D array of bool
+        Matrix with entry `[i, j]` being `self[i].is_superset_of(boxes[j])`.
+        Compares this box array against itself if `boxes` is not provided.
+
+    covering() : Box
+        The smallest box which covers all boxes in this box array.
+
+    """
+
+    def __init__(self, x, y, width, height):
+        self._x = np.asarray(x, dtype=np.int64)
+        self._y = np.asarray(y, dtype=np.int64)
+        self._width = np.asarray(width, dtype=np.int64)
+        self._height = np.asarray(height, dtype=np.int64)
+        return
+
+    @classmethod
+    def from_boxes(cls, boxes):
+        columns = np.reshape(
+            np.array([(b.x, b.y, b.width, b.height) for b in boxes],
+                     dtype=np.int64),
+            (-1, 4))
+        return cls(columns[:, 0], columns[:, 1], columns[:, 2], columns[:, 3])
+
+    def to_boxes(self):
+        return [Box(*b) for b in zip(self.x.tolist(), self.y.tolist(),
+                                     self.width.tolist(), self.height.tolist())]
+
+    @property
+    def x(self):
+        return self._x
+
+    @property
+    def y(self):
+        return self._y
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def right(self):
+        return (self.x + self.width)
+
+    @property
+    def bottom(self):
+        return (self.y + self.height)
+
+    @property
+    def center_x(self):
+        return (self.x + self.width // 2)
+
+    @property
+    def center_y(self):
+        return (self.y + self.height // 2)
+
+    @property
+    def area(self):
+        return (self.width * self.height)
+
+    def overlap(self, boxes=None):
+        boxes = self if boxes is None else boxes
+        w = np.clip(
+            np.minimum(self.right[:, np.newaxis], boxes.right[np.newaxis, :])
+            - np.maximum(self.x[:, np.newaxis], boxes.x[np.newaxis, :]),
+            0, None)
+        h = np.clip(
+            np.minimum(self.bottom[:, np.newaxis], boxes.bottom[np.newaxis, :])
+            - np.maximum(self.y[:, np.newaxis], boxes.y[np.newaxis, :]),
+            0, None)
+        return ((w * h) / boxes.area[np.newaxis, :])
+
+    def is_superset_of(self, boxes=None):
+        boxes = self if boxes is None else boxes
+        return ((self.x[:, np.newaxis] <= boxes.x[np.newaxis, :])
+                & (boxes.right[np.newaxis, :] <= self.right[:, np.newaxis])
+                & (self.y[:, np.newaxis] <= boxes.y[np.newaxis, :])
+                & (boxes.bottom[np.newaxis, :] <= self.bottom[:, np.newaxis]))
+
+    def covering(self):
+        x_min = np.amin(self.x)
+        y_min = np.amin(self.y)
+        cover = Box(int(x_min), int(y_min),
+                    int(np.amax(self.right) - x_min),
+                    int(np.amax(self.bottom) - y_min))
+        return cover
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, idxs):
+        if np.ndim(idxs) == 0 and not isinstance(idxs, slice):
+            return Box(int(self.x[idxs]), int(self.y[idxs]),
+                       int(self.width[idxs]), int(self.height[idxs]))
+        return BoxArray(self.x[idxs], self.y[idxs],
+                        self.width[idxs], self.height[idxs])
+
+
 def covering_box(boxes):
     """
     Construct the smallest box which covers a collection of boxes.
 
     Parameters
     ----------
-    boxes : iterable collection of Box
+    boxes : iterable collection of Box, or BoxArray
 
     Returns
     -------
     cover : Box
 
     """
-    x_min = np.amin([b.x for b in boxes])
-    x_max = np.amax([b.x + b.width for b in boxes])
-    y_min = np.amin([b.y for b in boxes])
-    y_max = np.amax([b.y + b.height for b in boxes])
-    cover = Box(x_min, y_min, x_max - x_min, y_max - y_min)
+    if isinstance(boxes, BoxArray):
+        return boxes.covering()
+    cover = BoxArray.from_boxes(boxes).covering()
     return cover
 
 
@@ -174,14 +417,18 @@ def bounding_box(points):
 
     Parameters
     ----------
-    points : iterable collection of (int, int)
+    points : iterable collection of (int, int), or 2-D array of int
 
     Returns
     -------
     bounding : Box
 
     """
-    x, y, w, h = cv2.boundingRect(np.array([p for p in points]))
+    if isinstance(points, np.ndarray):
+        points = np.ascontiguousarray(points.reshape(-1, 2), dtype=np.int32)
+    else:
+        points = np.array([p for p in points], dtype=np.int32)
+    x, y, w, h = cv2.boundingRect(points)
     bounding = Box(x, y, w, h)
     return bounding
 
@@ -201,24 +448,40 @@ def merge_overlapping(boxes, max_overlap=0.05):
     -------
     boxes_merged : list of Box
 
+    Notes
+    -----
+    Each box is merged with the merged boxes it overlaps, and the result is
+    merged again until it overlaps none.
+    Overlapping candidates are found through a `BoxIndex` of the merged boxes,
+    so that each box is only compared against the merged boxes it intersects.
+
     """
     def overlaps(bi, bj):
         return (bi.overlap(bj) >= max_overlap
                 or bj.overlap(bi) >= max_overlap)
 
-    def merge_into(boxes, box):
-        overlapping = [b for b in boxes if overlaps(box, b)]
-        if (len(overlapping) == 0):
-            return (boxes + [box])
-        else:
-            preserved = [b for b in boxes if not overlaps(box, b)]
-            merged = covering_box(overlapping + [box])
-            return (merge_into(preserved, merged))
-
-    boxes_merged = []
-    for b in boxes:
-        boxes_merged = merge_into(boxes_merged, b)
-    return boxes_merged
+    boxes = list(boxes)
+    if max_overlap <= 0:
+        # every pair of boxes overlaps, and so all are merged into one
+        return [covering_box(boxes)] if boxes else []
+
+    # merged boxes, keyed by their key in the index, in the order they would be
+    # listed by a recursive merge
+    index = BoxIndex(cell_size=64)
+    boxes_merged = dict()
+    for box in boxes:
+        while True:
+            overlapping = [k for k in index.intersecting(box)
+                           if overlaps(box, boxes_merged[k])]
+            if not overlapping:
+                break
+
+            box = covering_box([boxes_merged[k] for k in overlapping] + [box])
+            for k in overlapping:
+                index.remove(k)
+                del boxes_merged[k]
+        boxes_merged[index.insert(box)] = box
+    return list(boxes_merged.values())
 
 
 def otsu_separation(img_gray, box):
@@ -271,10 +534,328 @@ def otsu_separation_color(img, box):
         of `img` and its grayscale transformation.
 
     """
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    min_otsu_sep = np.amin(
-        [otsu_separation(img_gray, box),
-         otsu_separation(img[:, :, 0], box),
-         otsu_separation(img[:, :, 1], box),
-         otsu_separation(img[:, :, 2], box)])
-    return min_otsu_sep
+    return OtsuContext(img).separation(box)
+
+
+class OtsuContext:
+    """
+    Otsu separations of a colour image restricted to boxes, as per
+    `otsu_separation_color()`.
+
+    The image is converted to grayscale and split into its channels once, and
+    the separation of each box is calculated at most once.
+    If `integral` is enabled, an `IntegralHistogram` of each channel is built
+    upon construction, and the separations are calculated from the histograms
+    of the boxes rather than by thresholding each box of each channel.
+
+    Attributes
+    ----------
+    channels : list of 2-D array of int
+        The grayscale transformation and the colour channels of the image.
+
+    histograms : list of IntegralHistogram, or None
+        The integral histograms of the channels, if `integral` is enabled.
+
+    Methods
+    -------
+    separation(box) : float
+        The minimum of the Otsu separations of each channel, restricted to
+        `box`.
+
+    separations(boxes) : list of float
+        The separations of each box, as per `separation()`.
+        With `integral` enabled, the separations of all boxes are calculated
+        together.
+
+    """
+
+    def __init__(self, img, img_gray=None, integral=False):
+        if img_gray is None:
+            img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        self._channels = [img_gray] + list(cv2.split(img))
+        self._histograms = None
+        if integral:
+            self._histograms = [IntegralHistogram(c) for c in self._channels]
+        self._separations = dict()
+        return
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def histograms(self):
+        return self._histograms
+
+    def separation(self, box):
+        return self.separations([box])[0]
+
+    def separations(self, boxes):
+        keys = [(b.x, b.y, b.width, b.height) for b in boxes]
+        missing = list(dict.fromkeys(
+            [k for k in keys if k not in self._separations]))
+        if missing and self.histograms is None:
+            for k in missing:
+                self._separations[k] = np.amin(
+                    [otsu_separation(c, Box(*k)) for c in self.channels])
+        elif missing:
+            boxes_missing = [Box(*k) for k in missing]
+            seps = []
+            for ih in self.histograms:
+                _, means_b, means_w = otsu_class_means(
+                    ih.histograms(boxes_missing))
+                seps.append(means_w - means_b)
+            for k, sep in zip(missing, np.amin(seps, axis=0).tolist()):
+                self._separations[k] = sep
+        return [self._separations[k] for k in keys]
+
+
+class IntegralHistogram:
+    """
+    Integral histogram of a single-channel 8-bit image, over square tiles.
+
+    The histograms of the tiles are accumulated in both directions, so that the
+    histogram of the whole tiles within a box is found from four lookups.
+    The pixels of the box which lie outside of its whole tiles, in strips of
+    less than a tile around its edges, are counted directly.
+
+    Attributes
+    ----------
+    img_gray : 2-D array of uint8
+        Single channel image.
+
+    tile_size : int
+        Side length of the square tiles.
+
+    tiles : 3-D array of int32
+        Array with entry `[ty, tx]` being the histogram of the image restricted
+        to the first `ty` rows and `tx` columns of tiles.
+
+    Methods
+    -------
+    histogram(box) : 1-D array of int
+        The 256-bin histogram of the image restricted to `box`.
+
+    histograms(boxes) : 2-D array of int
+        Array with row `[k]` being the 256-bin histogram of the image
+        restricted to `boxes[k]`.
+
+    """
+
+    def __init__(self, img_gray, tile_size=16):
+        self._img_gray = np.ascontiguousarray(img_gray, dtype=np.uint8)
+        self._tile_size = tile_size
+
+        H, W = self._img_gray.shape[:2]
+        ny = -(-H // tile_size)
+        nx = -(-W // tile_size)
+        tile_y = np.arange(H) // tile_size
+        tile_x = np.arange(W) // tile_size
+        bins = ((tile_y[:, np.newaxis] * nx + tile_x[np.newaxis, :]) * 256
+                + self._img_gray)
+        counts = np.bincount(bins.ravel(), minlength=ny*nx*256)
+
+        self._tiles = np.zeros((ny + 1, nx + 1, 256), dtype=np.int32)
+        self._tiles[1:, 1:] = np.cumsum(
+            np.cumsum(counts.reshape(ny, nx, 256), axis=0), axis=1)
+        return
+
+    @property
+    def img_gray(self):
+        return self._img_gray
+
+    @property
+    def tile_size(self):
+        return self._tile_size
+
+    @property
+    def tiles(self):
+        return self._tiles
+
+    def histogram(self, box):
+        return self.histograms([box])[0]
+
+    def histograms(self, boxes):
+        H, W = self.img_gray.shape[:2]
+        ts = self.tile_size
+        boxes = BoxArray.from_boxes(boxes)
+        n = len(boxes)
+
+        x0 = np.clip(boxes.x, 0, W)
+        y0 = np.clip(boxes.y, 0, H)
+        x1 = np.clip(boxes.right, x0, W)
+        y1 = np.clip(boxes.bottom, y0, H)
+
+        # whole tiles, where the last tiles may be cut short by the image
+        tx0 = -(-x0 // ts)
+        ty0 = -(-y0 // ts)
+        tx1 = np.where(x1 < W, x1 // ts, self.tiles.shape[1] - 1)
+        ty1 = np.where(y1 < H, y1 // ts, self.tiles.shape[0] - 1)
+        whole = (tx0 < tx1) & (ty0 < ty1)
+        tx1 = np.where(whole, tx1, tx0)
+        ty1 = np.where(whole, ty1, ty0)
+
+        t = self.tiles
+        hists = (t[ty1, tx1].astype(np.int64) - t[ty0, tx1] - t[ty1, tx0]
+                 + t[ty0, tx0])
+
+        # the strips around the whole tiles, or the whole box if it has none
+        xa = np.where(whole, np.minimum(tx0 * ts, x1), x1)
+        xb = np.where(whole, np.minimum(tx1 * ts, W), x1)
+        ya = np.where(whole, np.minimum(ty0 * ts, y1), y1)
+        yb = np.where(whole, np.minimum(ty1 * ts, H), y1)
+
+        img = self.img_gray
+        strips = []
+        for k, (x0k, x1k, y0k, y1k, xak, xbk, yak, ybk) in enumerate(zip(
+                x0.tolist(), x1.tolist(), y0.tolist(), y1.tolist(),
+                xa.tolist(), xb.tolist(), ya.tolist(), yb.tolist())):
+            strips += [img[y0k:yak, x0k:x1k].ravel(),
+                       img[ybk:y1k, x0k:x1k].ravel(),
+                       img[yak:ybk, x0k:xak].ravel(),
+                       img[yak:ybk, xbk:x1k].ravel()]
+        sizes = [len(strip) for strip in strips]
+        if strips:
+            bins = (np.repeat(np.arange(4*n) // 4 * 256, sizes)
+                    + np.concatenate(strips))
+            hists += np.bincount(bins, minlength=n*256).reshape(n, 256)
+        return hists
+
+
+def otsu_thresholds(hists):
+    """
+    Calculate the Otsu thresholds of a collection of 256-bin histograms.
+
+    The between-class variances are calculated for all thresholds of all
+    histograms at once, which gives the same classes as `cv2.threshold()` with
+    `THRESH_OTSU`.
+    Only for those histograms whose largest variance is not clear of the others
+    by far more than their rounding error are the variances calculated again,
+    one threshold at a time, in the same order of operations as OpenCV.
+
+    Parameters
+    ----------
+    hists : 2-D array of int
+        Array with each row being a histogram of 8-bit values.
+
+    Returns
+    -------
+    ts : 1-D array of int
+        The thresholds, with values above them classed as white and values at
+        or below them classed as black.
+        Where OpenCV settles on a threshold within a run of empty bins, this is
+        the lowest threshold of that run, which classes all values the same.
+
+    """
+    hists = np.reshape(np.asarray(hists, dtype=np.int64), (-1, 256))
+    n = np.sum(hists, axis=1)[:, np.newaxis]
+    counts_1 = np.cumsum(hists, axis=1)
+    sums_1 = np.cumsum(hists * np.arange(256), axis=1)
+
+    # thresholds within a run of empty bins class all values the same as the
+    # threshold at the start of the run, and one class is empty below the first
+    # and from the last non-empty bin
+    valid = (hists > 0) & (counts_1 < n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        q_1 = counts_1 / n
+        mu_1 = sums_1 / counts_1
+        mu_2 = (sums_1[:, -1:] - sums_1) / (n - counts_1)
+        sigmas = np.where(valid, q_1 * (1.0 - q_1) * (mu_1 - mu_2) ** 2, -1.0)
+
+    ts = np.argmax(sigmas, axis=1)
+    sigmas_max = sigmas[np.arange(len(ts)), ts]
+    ts[sigmas_max < 0] = 0
+
+    clear = ((np.count_nonzero(
+        sigmas >= (sigmas_max * (1.0 - 1e-9))[:, np.newaxis], axis=1) == 1)
+             | (sigmas_max < 0))
+    for k in np.flatnonzero(~clear | (n[:, 0] >= 2**22)):
+        ts[k] = otsu_threshold_sequential(hists[k])
+    return ts
+
+
+def otsu_threshold_sequential(hist):
+    """
+    Calculate the Otsu threshold of a 256-bin histogram, one threshold at a
+    time, exactly as `cv2.threshold()` with `THRESH_OTSU` does.
+
+    Parameters
+    ----------
+    hist : 1-D array of int
+        Histogram of 8-bit values.
+
+    Returns
+    -------
+    int
+        The threshold, with values above it classed as white and values at or
+        below it classed as black.
+
+    """
+    hist = np.asarray(hist, dtype=np.int64)
+    nonzero = np.flatnonzero(hist)
+    if len(nonzero) < 2:
+        return 0
+
+    scale = 1.0 / int(np.sum(hist))
+    mu = float(np.dot(nonzero, hist[nonzero])) * scale
+    eps = float(np.finfo(np.float32).eps)
+
+    # below the first and above the last non-empty bin, one class is empty
+    mu_1 = 0.0
+    q_1 = 0.0
+    max_sigma = 0.0
+    max_value = 0
+    for i, h in zip(range(nonzero[0], nonzero[-1] + 1),
+                    hist[nonzero[0]:nonzero[-1] + 1].tolist()):
+        p_i = h * scale
+        mu_1 *= q_1
+        q_1 += p_i
+        q_2 = 1.0 - q_1
+
+        if min(q_1, q_2) < eps or max(q_1, q_2) > 1.0 - eps:
+            continue
+
+        mu_1 = (mu_1 + i * p_i) / q_1
+        mu_2 = (mu - q_1 * mu_1) / q_2
+        sigma = q_1 * q_2 * (mu_1 - mu_2) * (mu_1 - mu_2)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            max_value = i
+    return max_value
+
+
+def otsu_class_means(hists):
+    """
+    Calculate the Otsu thresholds and class means of a collection of 256-bin
+    histograms.
+
+    Parameters
+    ----------
+    hists : 2-D array of int
+        Array with each row being a histogram of 8-bit values.
+
+    Returns
+    -------
+    ts : 1-D array of int
+        The Otsu thresholds, as per `otsu_thresholds()`.
+    means_b : 1-D array of float
+        The means of the values at or below the thresholds, or nan if there
+        are none.
+    means_w : 1-D array of float
+        The means of the values above the thresholds, or nan if there are none.
+
+    """
+    hists = np.reshape(np.asarray(hists, dtype=np.int64), (-1, 256))
+    ts = otsu_thresholds(hists)
+    counts = np.cumsum(hists, axis=1)
+    sums = np.cumsum(hists * np.arange(256), axis=1)
+
+    rows = np.arange(len(ts))
+    n_b = counts[rows, ts]
+    n_w = counts[:, -1] - n_b
+    s_b = sums[rows, ts]
+    s_w = sums[:, -1] - s_b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means_b = np.where(n_b > 0, s_b / n_b, np.nan)
+        means_w = np.where(n_w > 0, s_w / n_w, np.nan)
+    return ts, means_b, means_w
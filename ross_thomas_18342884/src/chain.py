@@ -27,45 +27,132 @@ def linked(region_1, region_2):
 
     """
 
+    boxes_1 = BoxArray.from_boxes([region_1.box])
+    boxes_2 = BoxArray.from_boxes([region_2.box])
+    return bool(linked_pairs(boxes_1, boxes_2)[0])
+
+
+def linked_pairs(boxes_1, boxes_2):
+    """
+    Determine which pairs of boxes, of two box arrays of equal length, are
+    linked.
+
+    Parameters
+    ----------
+    boxes_1 : BoxArray
+    boxes_2 : BoxArray
+
+    Returns
+    -------
+    1-D array of bool
+        Array with entry `[k]` true if the boxes `boxes_1[k]` and `boxes_2[k]`
+        are linked, as per `linked()`.
+
+    """
+
     # these are ratios with regard to box heights
     max_ratio_diff_y = 0.5
     max_ratio_diff_height = 0.2
     max_ratio_diff_x = 1.0
     max_overlap = 0.25
 
-    diff_x = np.abs(region_2.box.x - region_1.box.x)
-    diff_y = np.abs(region_2.box.y - region_1.box.y)
-    diff_height = np.abs(region_2.box.height - region_1.box.height)
+    h1 = boxes_1.height
+    h2 = boxes_2.height
+
+    diff_x = np.abs(boxes_2.x - boxes_1.x)
+    diff_y = np.abs(boxes_2.y - boxes_1.y)
+    diff_height = np.abs(h2 - h1)
 
     similar_height = (
-        diff_height <= max_ratio_diff_height*region_1.box.height
-        and diff_height <= max_ratio_diff_height*region_2.box.height)
+        (diff_height <= max_ratio_diff_height*h1)
+        & (diff_height <= max_ratio_diff_height*h2))
 
     similar_y = (
-        diff_y <= max_ratio_diff_y*region_1.box.height
-        and diff_y <= max_ratio_diff_y*region_2.box.height)
+        (diff_y <= max_ratio_diff_y*h1)
+        & (diff_y <= max_ratio_diff_y*h2))
 
     adjacent_x = (
-        diff_x <= max_ratio_diff_x*region_1.box.height
-        and diff_x <= max_ratio_diff_x*region_2.box.height)
+        (diff_x <= max_ratio_diff_x*h1)
+        & (diff_x <= max_ratio_diff_x*h2))
+
+    superset = ((boxes_1.x <= boxes_2.x)
+                & (boxes_2.right <= boxes_1.right)
+                & (boxes_1.y <= boxes_2.y)
+                & (boxes_2.bottom <= boxes_1.bottom))
+
+    w = np.clip(np.minimum(boxes_1.right, boxes_2.right)
+                - np.maximum(boxes_1.x, boxes_2.x), 0, None)
+    h = np.clip(np.minimum(boxes_1.bottom, boxes_2.bottom)
+                - np.maximum(boxes_1.y, boxes_2.y), 0, None)
 
     non_occluding = (
-        (not region_1.box.is_superset_of(region_2.box))
-        and region_1.box.overlap(region_2.box) <= max_overlap
-        and region_2.box.overlap(region_1.box) <= max_overlap)
+        (~superset)
+        & ((w * h) / boxes_2.area <= max_overlap)
+        & ((w * h) / boxes_1.area <= max_overlap))
+
+    return (similar_height & similar_y & adjacent_x & non_occluding)
+
+
+def linked_matrix(boxes_1, boxes_2):
+    """
+    Determine which pairs of boxes, of two box arrays, are linked.
+
+    Parameters
+    ----------
+    boxes_1 : BoxArray
+    boxes_2 : BoxArray
+
+    Returns
+    -------
+    2-D array of bool
+        Matrix with entry `[i, j]` true if the boxes `boxes_1[i]` and
+        `boxes_2[j]` are linked, as per `linked()`.
+
+    """
+    n1 = len(boxes_1)
+    n2 = len(boxes_2)
+    idxs_1 = np.repeat(np.arange(n1), n2)
+    idxs_2 = np.tile(np.arange(n2), n1)
+    return linked_pairs(boxes_1[idxs_1], boxes_2[idxs_2]).reshape(n1, n2)
+
+
+def candidate_links(boxes):
+    """
+    Find the pairs of boxes, of a box array sorted by `x`, which may be linked.
+
+    As linked boxes are at most one box height apart in `x`, each box need only
+    be compared against the boxes to its right up to its own height away,
+    which are found by a binary search of the sorted `x` coordinates.
+
+    Parameters
+    ----------
+    boxes : BoxArray
+        Box array sorted by increasing `x`.
+
+    Returns
+    -------
+    idxs_1 : 1-D array of int
+    idxs_2 : 1-D array of int
+        Indexes of the candidate pairs, with `idxs_1[k] < idxs_2[k]`, ordered by
+        `idxs_1` then `idxs_2`.
+
+    """
+    n = len(boxes)
+    ends = np.searchsorted(boxes.x, boxes.x + boxes.height, side="right")
+    counts = ends - np.arange(n) - 1
 
-    return (similar_height and similar_y and adjacent_x and non_occluding)
+    idxs_1 = np.repeat(np.arange(n), counts)
+    offsets = np.arange(len(idxs_1)) - np.repeat(np.cumsum(counts) - counts,
+                                                 counts)
+    idxs_2 = idxs_1 + offsets + 1
+    return idxs_1, idxs_2
 
 
-def find_chains(regions, best_edge=True):
+def find_chains(regions, best_edge=True, max_paths=None, max_length=None):
     """
     Find all non-overlapping chains of regions, in a set of regions.
 
-    Finds all links between regions, then filters the edges by distance between
-    to regions to ensure each region has at most one adjacent region to their
-    right and at most one adjacent region to their left - ensuring all paths are
-    non-overlapping.
-    All paths are then extracted and are said to be chains of regions.
+    Collects the chains yielded by `iter_chains()`.
 
     Parameters
     ----------
@@ -73,45 +160,97 @@ def find_chains(regions, best_edge=True):
     best_edge : bool, default=True
         Disabling this results in the edges not being filtered, and so
         overlapping paths may be extracted.
+    max_paths : int, default=None
+        If provided, at most this many chains are found.
+    max_length : int, default=None
+        If provided, chains of more than this many regions are discarded.
 
     Returns
     -------
     list of list of Region
         List of chains (represented as a list of regions) of adjacent regions.
 
+    """
+    return list(iter_chains(regions, best_edge, max_paths, max_length))
+
+
+def iter_chains(regions, best_edge=True, max_paths=None, max_length=None):
+    """
+    Generate all non-overlapping chains of regions, in a set of regions.
+
+    Finds all links between regions, comparing each region only against the
+    regions within one box height to its right, then filters the edges by
+    distance between to regions to ensure each region has at most one adjacent
+    region to their right and at most one adjacent region to their left -
+    ensuring all paths are non-overlapping.
+    All paths are then extracted, depth-first and without recursion, and are
+    said to be chains of regions.
+
+    Parameters
+    ----------
+    regions : list of Region
+    best_edge : bool, default=True
+        Disabling this results in the edges not being filtered, and so
+        overlapping paths may be extracted.
+    max_paths : int, default=None
+        If provided, the generator stops after this many chains.
+    max_length : int, default=None
+        If provided, chains of more than this many regions are discarded, and
+        paths are not extended beyond this length.
+
+    Yields
+    ------
+    list of Region
+        Chain (represented as a list of regions) of adjacent regions.
+
     """
     regions_ordered = sorted(regions, key=lambda r: r.box.x)
     n = len(regions_ordered)
 
+    boxes = BoxArray.from_boxes([r.box for r in regions_ordered])
+    idxs_1, idxs_2 = candidate_links(boxes)
+    is_linked = linked_pairs(boxes[idxs_1], boxes[idxs_2])
+    idxs_1, idxs_2 = (idxs_1[is_linked], idxs_2[is_linked])
+    links_all = np.split(idxs_2, np.searchsorted(idxs_1, np.arange(1, n)))
+
     edges = dict()
     roots = set(range(0, n))
     for i in range(n):
         ri = regions_ordered[i]
 
-        links = {j for j in range(i+1, n) if linked(ri, regions_ordered[j])}
-        if best_edge:
-            links_sorted = sorted(
-                links,
-                key=(lambda j: ri.distance(regions_ordered[j].box.center)))
-            links = set(links_sorted[:1])
+        links = set(links_all[i].tolist())
+        if best_edge and links:
+            links_listed = list(links)
+            distances = ri.distances(
+                [regions_ordered[j].box.center for j in links_listed])
+            links = {links_listed[np.argmin(distances)]}
 
         edges[i] = links
         roots -= edges[i]
         if not edges[i]:
             roots -= {i}
 
-    def paths(i):
-        if edges[i]:
-            suffixes = [p for j in edges[i] for p in paths(j)]
-            return [[i] + s for s in suffixes]
-        else:
-            return [[i]]
+    count = 0
+    for i in roots:
+        stack = [[i]]
+        while stack:
+            path = stack.pop()
+            if max_length is not None and len(path) > max_length:
+                continue
+
+            links = edges[path[-1]]
+            if links:
+                # pushed in reverse, so that paths are popped in edge order
+                stack += [path + [j] for j in reversed(list(links))]
+                continue
 
-    chains = [p for i in roots for p in paths(i)]
-    return [list(map(lambda i: regions_ordered[i], c)) for c in chains]
+            if max_paths is not None and count >= max_paths:
+                return
+            yield [regions_ordered[k] for k in path]
+            count += 1
 
 
-def cluster_largest_otsu_separations(img, chains, max_diff=50):
+def cluster_largest_otsu_separations(img, chains, max_diff=50, img_gray=None):
     """
     Filters a set of chains, to leave the most monochromatic chains.
 
@@ -130,6 +269,8 @@ def cluster_largest_otsu_separations(img, chains, max_diff=50):
         The cluster of most separated chains is parameterised by this value;
         once ordered by decreasing separation, chains are taken until the change
         in separation from one chain to the next is more than `max_diff`.
+    img_gray : 2-D array of int, default=None
+        Grayscale transformation of `img`, which is calculated if not provided.
 
     Returns
     -------
@@ -141,15 +282,14 @@ def cluster_largest_otsu_separations(img, chains, max_diff=50):
     if not chains:
         return chains
 
-    chains_ordered = sorted(
-        chains,
-        key=(lambda c: \
-             otsu_separation_color(img, covering_box([r.box for r in c]))),
-        reverse=True)
+    otsu = OtsuContext(img, img_gray)
+    separations = otsu.separations(
+        [covering_box([r.box for r in c]) for c in chains])
 
-    otsu_seps = np.array(
-        [otsu_separation_color(img, covering_box([r.box for r in c]))
-         for c in chains_ordered])
+    order = sorted(range(len(chains)), key=lambda k: separations[k],
+                   reverse=True)
+    chains_ordered = [chains[k] for k in order]
+    otsu_seps = np.array([separations[k] for k in order])
 
     n = len(otsu_seps)
     idx = n-1
@@ -182,34 +322,64 @@ def aligned(chain_1, chain_2):
         Flag true if the two chains are aligned.
 
     """
-    n1 = len(chain_1)
-    n2 = len(chain_2)
+    return bool(aligned_matrix([chain_1, chain_2])[0, 1])
 
-    if (not (2 <= n1 <= 3)) and (not (2 <= n2 <= 3)):
-        return False
 
-    norm = lambda p: np.sqrt(np.abs((p[0] ** 2) + (p[1] ** 2)))
-    diff = lambda p1, p2: (p1[0] - p2[0], p1[1] - p2[1])
-
-    box_1 = covering_box([r.box for r in chain_1])
-    box_2 = covering_box([r.box for r in chain_2])
-    w = min([box_1.width, box_2.width])
+def aligned_matrix(chains):
+    """
+    Determine which pairs of chains, of a set of chains, are aligned.
 
-    n = min([n1, n2])
-    digits_1 = {i: chain_1[n1-i-1] for i in range(n)}
-    digits_2 = {i: chain_2[n2-i-1] for i in range(n)}
+    Each pair of chains is compared once, with the comparisons of all pairs
+    calculated together from the covering boxes of the chains, and the boxes of
+    their three right-most regions.
 
-    aligned_vert = np.all(
-        [np.abs(diff(digits_1[i].box.center, digits_2[i].box.center)[0])
-         <= w
-         for i in range(n)])
+    Parameters
+    ----------
+    chains : list of list of Region
 
-    similar_heights = np.all(
-        [np.abs(digits_1[i].box.height - digits_2[i].box.height)
-         <= 0.2 * min([digits_1[i].box.height, digits_2[i].box.height])
-         for i in range(n)])
+    Returns
+    -------
+    2-D array of bool
+        Symmetric matrix with entry `[i, j]` true if the chains `chains[i]` and
+        `chains[j]` are aligned, as per `aligned()`, for `i != j`.
 
-    return (aligned_vert and similar_heights)
+    """
+    n = len(chains)
+    lengths = np.array([len(c) for c in chains], dtype=np.int64)
+    covers = BoxArray.from_boxes(
+        [covering_box([r.box for r in c]) for c in chains])
+
+    # boxes of the right-most regions, from the right, padded to 3 regions
+    max_digits = 3
+    digits = BoxArray.from_boxes(
+        [c[len(c)-k-1].box if k < len(c) else Box(0, 0, 0, 0)
+         for c in chains for k in range(max_digits)])
+    center_x = digits.center_x.reshape(n, max_digits)
+    height = digits.height.reshape(n, max_digits)
+
+    idxs_1, idxs_2 = np.triu_indices(n, 1)
+    n1 = lengths[idxs_1]
+    n2 = lengths[idxs_2]
+    w = np.minimum(covers.width[idxs_1], covers.width[idxs_2])
+
+    # the digits of a pair beyond the shorter chain are not compared
+    compared = (np.arange(max_digits)[np.newaxis, :]
+                < np.minimum(n1, n2)[:, np.newaxis])
+
+    h1 = height[idxs_1]
+    h2 = height[idxs_2]
+    aligned_vert = (
+        np.abs(center_x[idxs_1] - center_x[idxs_2]) <= w[:, np.newaxis])
+    similar_heights = (np.abs(h1 - h2) <= 0.2 * np.minimum(h1, h2))
+
+    is_aligned = (
+        (((2 <= n1) & (n1 <= 3)) | ((2 <= n2) & (n2 <= 3)))
+        & np.all((aligned_vert & similar_heights) | ~compared, axis=1))
+
+    matrix = np.zeros((n, n), dtype=bool)
+    matrix[idxs_1, idxs_2] = is_aligned
+    matrix[idxs_2, idxs_1] = is_aligned
+    return matrix
 
 
 def find_aligned_chains(chains):
@@ -217,8 +387,9 @@ def find_aligned_chains(chains):
     Find the largest subset of aligned chains, from a set of chains.
 
     Each pair of chains is compared for alignment, forming a graph of chains.
-    This graph is then searched (depth-first) to form a partition of `chains`
-    which groups chains by alignment, and connectedness thereof.
+    The connected components of this graph, found by union-find, form a
+    partition of `chains` which groups chains by alignment, and connectedness
+    thereof.
     The largest subset of aligned chains is assumed to be the subset of
     interest, and is returned.
 
@@ -229,40 +400,40 @@ def find_aligned_chains(chains):
     Returns
     -------
     list of list of Region
-        The largest subset of chains which are aligned.
+        The largest subset of chains which are aligned, ordered by the `y`
+        placement of their covering boxes, or an empty list if no two chains
+        are aligned.
 
     """
     chains_ordered = sorted(
         chains, key=lambda c: covering_box([r.box for r in c]).y)
     n = len(chains_ordered)
 
-    edges = dict()
-    for i, ci in enumerate(chains_ordered[0:n]):
-        edges[i] = {j for j, cj in enumerate(chains_ordered)
-                    if (j != i and aligned(ci, cj))}
-
-    def dfs(explored, i):
-        idxs = {i}
-        if i not in explored:
-            explored |= {i}
-            for j in edges[i]:
-                idxs |= dfs(explored, j)
-        return idxs
-
-    k = 0
+    parents = list(range(n))
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    idxs_1, idxs_2 = np.nonzero(np.triu(aligned_matrix(chains_ordered)))
+    for i, j in zip(idxs_1.tolist(), idxs_2.tolist()):
+        ri, rj = (root(i), root(j))
+        if ri != rj:
+            parents[max(ri, rj)] = min(ri, rj)
+
+    # components are keyed, and so ordered, by their first chain
     eq_classes = dict()
-    explored = set()
     for i in range(n):
-        if i not in explored:
-            eq_classes[k] = dfs(explored, i)
-            k += 1
+        eq_classes.setdefault(root(i), []).append(i)
 
     aligned_chains = [[chains_ordered[j]
                        for j in eq_classes[k]]
                       for k in eq_classes
                       if len(eq_classes[k]) > 1]
 
-    return max(aligned_chains, key=lambda ac: len(ac))
+    return max(aligned_chains, key=lambda ac: len(ac), default=[])
 
 
 def find_missing_digits(aligned_chains, img_gray):
@@ -271,10 +442,11 @@ def find_missing_digits(aligned_chains, img_gray):
 
     For each chain, of only two regions, in a set of aligned chains, the
     bounding box of the missing left digit is estimated.
-    The grayscale image is then restricted to this box, thresholded to a binary
-    image, and the connected components are calculated.
-    The largest connected component is assumed to be the missing digit, and
-    prepended to the chain.
+    The grayscale image is then restricted to this box, and thresholded to a
+    binary image.
+    The connected components of the binary images of all such chains are
+    calculated together, and the largest connected component of each is
+    assumed to be the missing digit, and prepended to the chain.
 
     Parameters
     ----------
@@ -289,17 +461,17 @@ def find_missing_digits(aligned_chains, img_gray):
     -------
     aligned_chains_found : list of list of Region
         List of chains (of exactly three regions) with all missing left digits
-        localised and found.
+        localised and found; a chain for which no digit is found is left as it
+        is.
 
     """
     H, W = img_gray.shape[:2]
 
-    aligned_chains_found = []
-    for chain in aligned_chains:
+    left_boxes = dict()
+    for k, chain in enumerate(aligned_chains):
         n = len(chain)
 
         if n == 3:
-            aligned_chains_found.append(chain)
             continue
 
         digit_2 = chain[n-2]
@@ -313,20 +485,31 @@ def find_missing_digits(aligned_chains, img_gray):
         y = min([H - 1, max([0, box.tl[1] - diff_y])])
         w = box.tl[0] - x - 1
         h = min([H - y - 1, max([digit_2.box.height, digit_3.box.height])])
-        left_box = Box(x, y, w, h)
+        left_boxes[k] = Box(x, y, w, h)
 
+    imgs_bin = []
+    for left_box in left_boxes.values():
         img_box = (img_gray[left_box.indexes]).astype(np.uint8)
-        t, img_bin = cv2.threshold(img_box, 128, 255, cv2.THRESH_OTSU)
-        regions = cc_regions(img_bin)
+        if img_box.size:
+            t, img_bin = cv2.threshold(img_box, 128, 255, cv2.THRESH_OTSU)
+        else:
+            img_bin = img_box
+        imgs_bin.append(img_bin)
 
-        region = max(regions, key=lambda r: r.area)
-        digit_1 = Region({(x + p[0], y + p[1]) for p in region.points})
+    digits_1 = dict(zip(left_boxes, cc_largest_regions(
+        imgs_bin, [b.tl for b in left_boxes.values()])))
 
-        aligned_chains_found.append([digit_1, digit_2, digit_3])
+    aligned_chains_found = []
+    for k, chain in enumerate(aligned_chains):
+        n = len(chain)
+        if digits_1.get(k) is None:
+            aligned_chains_found.append(chain)
+        else:
+            aligned_chains_found.append([digits_1[k], chain[n-2], chain[n-1]])
     return aligned_chains_found
 
 
-def find_arrows(aligned_chains, regions):
+def find_arrows(aligned_chains, regions, index=None):
     """
     Find the directional arrows associated with each chain for a set of chains.
 
@@ -335,6 +518,8 @@ def find_arrows(aligned_chains, regions):
     region, and likely no other region.
     The region corresponding to the arrow is assumed to be contained maximally
     within this box.
+    Only the regions whose boxes intersect this box, as found through a spatial
+    index of the region boxes, are considered.
 
     Parameters
     ----------
@@ -344,6 +529,9 @@ def find_arrows(aligned_chains, regions):
     regions : list of Region
         List of regions which is assumed to contain the regions corresponding to
         the directional arrows.
+    index : BoxIndex, default=None
+        Spatial index of the boxes of `regions`, keyed by their position in
+        `regions`, which is constructed if not provided.
 
     Returns
     -------
@@ -351,6 +539,9 @@ def find_arrows(aligned_chains, regions):
         List of chains (of digits) and their associated directional arrow region.
 
     """
+    if index is None:
+        index = BoxIndex([r.box for r in regions])
+
     aligned_chains_arrows = []
     for chain in aligned_chains:
         n = len(chain)
@@ -361,6 +552,9 @@ def find_arrows(aligned_chains, regions):
         box = covering_box([digit_2.box, digit_3.box])
         right_box = Box(box.tr[0] + 1, box.tr[1], box.width, box.height)
 
-        arrow = max(regions, key=lambda r: right_box.overlap(r.box))
+        # with no intersecting region, all overlaps are 0 and the first wins
+        candidates = index.intersecting(right_box) or [0]
+        arrow = regions[max(
+            candidates, key=lambda k: right_box.overlap(regions[k].box))]
         aligned_chains_arrows.append((chain, arrow))
     return aligned_chains_arrows
@@ -1,41 +1,77 @@
 #!/usr/bin/env python3
 
-import os
 import numpy as np
 import cv2
 
 from region import *
+from template import *
 
 
 class KNN:
     """
-    k-Nearest Neighbour class, built around OpenCV's KNearest object.
+    k-Nearest Neighbour class, with a NumPy backend, one built around OpenCV's
+    KNearest object, or one built around a FLANN k-d tree index.
+
+    The "numpy" and "opencv" backends predict labels the same way. The k nearest training samples
+    are those with the least squared Euclidean distance, as float32, and ties
+    are broken in favour of the earlier training sample. The predicted label
+    is the one with the most votes, and ties are broken in favour of the
+    smallest internal label.
+    OpenCV accumulates distances in float32, so the two backends may disagree
+    on training samples whose distances differ only in the last bit.
+
+    The "kdtree" backend indexes the training samples, for sets of thousands of
+    samples. With `checks` of None, a single k-d tree is searched exactly, and
+    only ties at the k-th distance may be broken differently. Otherwise, a
+    forest of randomised k-d trees is searched approximately, with at most
+    `checks` leaves visited per sample; fewer checks are faster, and more are
+    more likely to find the exact k nearest.
 
     Attributes
     ----------
     labels : dict of (int, X), where X is type of label of samples
         A map between the int labels used internally, and the labels of the
         samples as provided to the `train()` method.
-    knn : cv2.ml.KNearest
+    backend : string
+        Backend used to predict class labels: "numpy", "opencv", or "kdtree".
+    checks : int, or None
+        Maximum number of leaves visited per sample by the "kdtree" backend,
+        or None for an exact search.
+    samples : 2-D array of float
+        Training samples, as rows.
+    responses : 1-D array of int
+        Internal labels of the training samples.
+    knn : cv2.ml.KNearest, cv2.flann_Index, or None
         The k-Nearest Neighbour object, trained on the sample data, which is
-        used to predict class labels for unlabelled sample data.
+        used to predict class labels for unlabelled sample data by the
+        "opencv" backend; or the index of the sample data, which is used to
+        find the nearest samples by the "kdtree" backend; None for the "numpy"
+        backend.
 
     Methods
     -------
     train(samples_labelled) :
-        Train `knn` on the labelled sample data, and build the map `labels`,
-        between internal labels for OpenCV's `train()` and `predict()` methods,
-        and the labels of `samples_labelled`.
+        Train the backend on the labelled sample data, and build the map
+        `labels`, between internal labels for the backend, and the labels of
+        `samples_labelled`.
 
     predict(samples, k=3) :
         Predict the class labels of `samples` using `k` neighbours, and the
-        trained `knn` object.
+        trained backend.
         The output labels are converted from the internal class labels to be of
         the same type as was provided during training.
 
+    predict_sets(sample_sets, k=3) :
+        Predict the class labels of each set of samples, such as the digits of
+        each chain of an image, with a single call to `predict()`.
+
     """
 
-    def __init__(self, samples_labelled):
+    def __init__(self, samples_labelled, backend="opencv", checks=None):
+        if backend not in {"numpy", "opencv", "kdtree"}:
+            raise ValueError(f"unknown KNN backend: {backend}")
+        self._backend = backend
+        self._checks = checks
         self.train(samples_labelled)
         return
 
@@ -43,6 +79,22 @@ class KNN:
     def labels(self):
         return self._labels
 
+    @property
+    def backend(self):
+        return self._backend
+
+    @property
+    def checks(self):
+        return self._checks
+
+    @property
+    def samples(self):
+        return self._samples
+
+    @property
+    def responses(self):
+        return self._responses
+
     @property
     def knn(self):
         return self._knn
@@ -58,23 +110,150 @@ class KNN:
             [np.full((samples_labelled[self.labels[k]].shape[0]), k)
              for k in self.labels])
 
-        self._knn = cv2.ml.KNearest_create()
-        self._knn.setIsClassifier(True)
-        self._knn.setAlgorithmType(cv2.ml.KNearest_BRUTE_FORCE)
-        self._knn.train(samples, cv2.ml.ROW_SAMPLE, responses)
+        self._samples = samples
+        self._responses = responses
+        self._knn = None
+
+        if self.backend == "opencv":
+            self._knn = cv2.ml.KNearest_create()
+            self._knn.setIsClassifier(True)
+            self._knn.setAlgorithmType(cv2.ml.KNearest_BRUTE_FORCE)
+            self._knn.train(samples, cv2.ml.ROW_SAMPLE, responses)
+        elif self.backend == "kdtree":
+            # FLANN's single k-d tree, for exact search, or a forest of
+            # randomised k-d trees, for approximate search
+            if self.checks is None:
+                params = dict(algorithm=4, leaf_max_size=10)
+            else:
+                params = dict(algorithm=1, trees=4)
+            self._knn = cv2.flann_Index(samples, params)
         return
 
     def predict(self, samples, k=3):
-        _, responses, _, dist = self.knn.findNearest(samples, k)
+        if len(samples) == 0:
+            return np.array([self.labels[0]])[:0]
+
+        if self.backend == "opencv":
+            _, responses, _, dist = self.knn.findNearest(
+                samples.astype(np.float32), k)
+            responses = responses[:, 0].astype(np.int32)
+        elif self.backend == "kdtree":
+            k = min(k, self.samples.shape[0])
+            # the exact search of a single k-d tree ignores its checks
+            checks = self.checks if self.checks is not None else 32
+            nearest, _ = self.knn.knnSearch(
+                np.ascontiguousarray(samples, dtype=np.float32), k,
+                params=dict(checks=checks))
+            responses = majority_vote(
+                self.responses[nearest], len(self.labels))
+        else:
+            responses = knn_vote(self.samples, self.responses,
+                                 len(self.labels), samples, k)
 
         labels_predicted = np.array(
-            [self.labels[np.int32(r[0])]
-             for i, r in enumerate(responses)])
+            [self.labels[r] for r in responses.tolist()])
 
         return labels_predicted
 
+    def predict_sets(self, sample_sets, k=3):
+        sizes = [len(s) for s in sample_sets]
+        if not sizes:
+            return []
+
+        labels_predicted = self.predict(np.concatenate(sample_sets), k)
+        return np.split(labels_predicted, np.cumsum(sizes)[:-1])
+
+
+def knn_vote(samples_train, responses_train, n_labels, samples, k,
+             max_distances=2**22):
+    """
+    Predict the internal labels of samples by a vote of their k nearest
+    training samples, by brute force.
+
+    The squared distances between a block of samples and every training sample
+    are calculated with a single matrix multiplication. The k nearest training
+    samples of each sample are then found with `np.argpartition`, which avoids
+    sorting all of its distances.
+
+    Parameters
+    ----------
+    samples_train : 2-D array of float
+        Training samples, as rows.
+    responses_train : 1-D array of int
+        Internal labels of the training samples, from 0 to `n_labels` - 1.
+    n_labels : int
+    samples : 2-D array of float
+        Samples to predict the labels of, as rows.
+    k : int
+        Number of neighbours; at most the number of training samples are used.
+    max_distances : int, default=2**22
+        Maximum number of distances calculated at once, which limits the number
+        of samples in each block.
+
+    Returns
+    -------
+    1-D array of int
+        Internal label of each sample.
 
-def build_knn_digits(dir_digits, bins_x, bins_y):
+    """
+    samples_train = samples_train.astype(np.float32).astype(np.float64)
+    samples = samples.astype(np.float32).astype(np.float64)
+    n_train = samples_train.shape[0]
+    k = min(k, n_train)
+    norms_train = np.einsum("ij,ij->i", samples_train, samples_train)
+
+    responses = np.empty(samples.shape[0], dtype=np.int32)
+    block = max(1, max_distances // max(1, n_train))
+    for i in range(0, samples.shape[0], block):
+        samples_i = samples[i:i+block]
+        n = samples_i.shape[0]
+
+        # distances are rounded to float32, as per OpenCV; the bits of a
+        # non-negative float32 are ordered as the float32 is, so each key
+        # orders training samples by distance, and then by index
+        dists = samples_i @ samples_train.T
+        dists *= -2
+        dists += norms_train
+        dists += np.einsum("ij,ij->i", samples_i, samples_i)[:, np.newaxis]
+        np.maximum(dists, 0, out=dists)
+        keys = dists.astype(np.float32).view(np.int32).astype(np.int64)
+        keys *= n_train
+        keys += np.arange(n_train)
+
+        nearest = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        responses[i:i+n] = majority_vote(responses_train[nearest], n_labels)
+
+    return responses
+
+
+def majority_vote(responses_nearest, n_labels):
+    """
+    Predict the internal label of each sample by a majority vote of the labels
+    of its nearest training samples.
+
+    Parameters
+    ----------
+    responses_nearest : 2-D array of int
+        Internal labels of the nearest training samples of each sample, as
+        rows.
+    n_labels : int
+
+    Returns
+    -------
+    1-D array of int
+        Internal label of each sample, with ties broken in favour of the
+        smallest label.
+
+    """
+    n = responses_nearest.shape[0]
+    votes = np.bincount(
+        (np.arange(n)[:, np.newaxis] * n_labels + responses_nearest).ravel(),
+        minlength=n * n_labels).reshape(n, n_labels)
+    return np.argmax(votes, axis=1)
+
+
+def build_knn_digits(dir_digits, bins_x, bins_y, cache_file=None,
+                     backend="opencv", checks=None, workers=None):
     """
     Construct a KNN object from a directory containing digit training images.
 
@@ -86,6 +265,15 @@ def build_knn_digits(dir_digits, bins_x, bins_y):
         Number of x-component bins for `spatial_occupancy()`.
     bins_y : int
         Number of y-component bins for `spatial_occupancy()`.
+    cache_file : string, default=None
+        Path for a file in which the training features are cached, as per
+        `cached_samples()`.
+    backend : string, default="opencv"
+        Backend of the KNN object, as per `KNN`.
+    checks : int, default=None
+        Maximum number of leaves visited by the "kdtree" backend, as per `KNN`.
+    workers : int, default=None
+        Number of threads loading the images, as per `load_templates()`.
 
     Returns
     -------
@@ -93,42 +281,13 @@ def build_knn_digits(dir_digits, bins_x, bins_y):
         k-Nearest Neighbour algorithm trained on the digit images provided.
 
     """
-    digits = {
-        0: "Zero",
-        1: "One",
-        2: "Two",
-        3: "Three",
-        4: "Four",
-        5: "Five",
-        6: "Six",
-        7: "Seven",
-        8: "Eight",
-        9: "Nine"}
-
-    imgs = dict()
-    for d in iter(digits):
-        for k in range(5):
-            digit_file = os.path.join(dir_digits, f"{digits[d]}{k+1}.jpg")
-            imgs[(d, k)] = cv2.imread(digit_file, cv2.IMREAD_COLOR)
-
-    samples = dict()
-    for d in iter(digits):
-        samples[d] = np.zeros((5, bins_x * bins_y), dtype=np.float32)
-        for k in range(5):
-            img_gray = cv2.cvtColor(imgs[(d, k)], cv2.COLOR_BGR2GRAY)
-            _, img_bin = cv2.threshold(img_gray, 128, 255, cv2.THRESH_OTSU)
-
-            regions = cc_regions(img_bin)
-            h, w = img_bin.shape[:2]
-            region = min(
-                regions, key=lambda r: r.distance((int(w/2), int(h/2))))
-
-            samples[d][k] = np.ravel(region.spatial_occupancy(bins_x, bins_y))
-
-    return KNN(samples)
-
-
-def build_knn_arrows(dir_arrows, bins_x, bins_y):
+    samples = load_templates(dir_digits, template_names_digits, bins_x, bins_y,
+                             cache_file, workers)
+    return KNN(samples, backend, checks)
+
+
+def build_knn_arrows(dir_arrows, bins_x, bins_y, cache_file=None,
+                     backend="opencv", checks=None, workers=None):
     """
     Construct a KNN object from a directory containing arrow training images.
 
@@ -140,6 +299,15 @@ def build_knn_arrows(dir_arrows, bins_x, bins_y):
         Number of x-component bins for `spatial_occupancy()`.
     bins_y : int
         Number of y-component bins for `spatial_occupancy()`.
+    cache_file : string, default=None
+        Path for a file in which the training features are cached, as per
+        `cached_samples()`.
+    backend : string, default="opencv"
+        Backend of the KNN object, as per `KNN`.
+    checks : int, default=None
+        Maximum number of leaves visited by the "kdtree" backend, as per `KNN`.
+    workers : int, default=None
+        Number of threads loading the images, as per `load_templates()`.
 
     Returns
     -------
@@ -147,28 +315,6 @@ def build_knn_arrows(dir_arrows, bins_x, bins_y):
         k-Nearest Neighbour algorithm trained on the arrow images provided.
 
     """
-    arrows = {
-        "L": "LeftArrow",
-        "R": "RightArrow"}
-
-    imgs = dict()
-    for a in iter(arrows):
-        for k in range(5):
-            arrow_file = os.path.join(dir_arrows, f"{arrows[a]}{k+1}.jpg")
-            imgs[(a, k)] = cv2.imread(arrow_file, cv2.IMREAD_COLOR)
-
-    samples = dict()
-    for a in iter(arrows):
-        samples[a] = np.zeros((5, bins_x * bins_y), dtype=np.float32)
-        for k in range(5):
-            img_gray = cv2.cvtColor(imgs[(a, k)], cv2.COLOR_BGR2GRAY)
-            _, img_bin = cv2.threshold(img_gray, 128, 255, cv2.THRESH_OTSU)
-
-            regions = cc_regions(img_bin)
-            h, w = img_bin.shape[:2]
-            region = min(
-                regions, key=lambda r: r.distance((int(w/2), int(h/2))))
-
-            samples[a][k] = np.ravel(region.spatial_occupancy(bins_x, bins_y))
-
-    return KNN(samples)
+    samples = load_templates(dir_arrows, template_names_arrows, bins_x, bins_y,
+                             cache_file, workers)
+    return KNN(samples, backend, checks)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+
+class Stage:
+    """
+    Stage of a pipeline, which filters or transforms a stream of items.
+
+    Attributes
+    ----------
+    name : string
+        Short name of the stage, such as the suffix of its work image.
+    description : string
+        Description of the stage, as logged when it is run.
+    function : callable
+        Predicate of a single item, if the stage is not a batch stage; or a
+        function of the list of all items, returning a list of items, if the
+        stage is a batch stage.
+    batch : bool
+        Flag true if the stage needs all of its items at once, such as a stage
+        which sorts or compares its items; otherwise the stage filters items
+        lazily, one at a time.
+
+    """
+
+    def __init__(self, name, description, function, batch=False):
+        self._name = name
+        self._description = description
+        self._function = function
+        self._batch = batch
+        return
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def description(self):
+        return self._description
+
+    @property
+    def function(self):
+        return self._function
+
+    @property
+    def batch(self):
+        return self._batch
+
+    def __str__(self):
+        properties = \
+            f"Stage:\n"\
+            + f"name = {self.name}\n"\
+            + f"description = {self.description}\n"\
+            + f"batch = {self.batch}"
+        return properties
+
+
+class Pipeline:
+    """
+    Sequence of stages, through which a stream of items is passed.
+
+    Consecutive filter stages are chained as lazy generators, so that no list
+    of items is built between them; only a batch stage collects the items
+    passed to it, and the list of items before it is released once it has run.
+
+    Attributes
+    ----------
+    stages : list of Stage
+
+    Methods
+    -------
+    run(items, log=None, capture=None) : generator of X
+        Passes the items through each stage in turn, yielding the items which
+        remain after the last stage.
+        If provided, `log(stage)` is called as each stage is reached, and
+        `capture(stage, items)` is called with the list of items remaining after
+        each stage, which forces the items to be collected at every stage
+        boundary.
+
+    """
+
+    def __init__(self, stages):
+        self._stages = list(stages)
+        return
+
+    @property
+    def stages(self):
+        return self._stages
+
+    def run(self, items, log=None, capture=None):
+        for stage in self.stages:
+            if log is not None:
+                log(stage)
+
+            if stage.batch:
+                items = stage.function(list(items))
+            else:
+                items = filter(stage.function, items)
+
+            if capture is not None:
+                items = list(items)
+                capture(stage, items)
+
+        yield from items
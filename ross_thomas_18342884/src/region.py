@@ -4,23 +4,61 @@ import numpy as np
 import cv2
 import math
 import random
+from collections import Counter
 
 from box import *
 
 
+# Counts of hits and misses of the derived feature caches of all regions,
+# keyed by `(feature, "hits")` and `(feature, "misses")`.
+cache_stats = Counter()
+
+
 class Region:
     """
     Connected region of points, suitable for use with OpenCV MSER.
 
+    A region holds only a reference to its point array and its box upon
+    construction; everything else, including its mask and area, is calculated
+    when first accessed, and then cached.
+
     Attributes
     ----------
-    points : set of (int, int)
-        Set of points that this region contains.
+    coords : 2-D array of int32
+        Array, of shape `(n, 2)`, of the `(x, y)` points that this region was
+        constructed from.
         These points are assumed, but not checked, upon construction to be
         connected.
 
     box : Box
         Minimal bounding box of this region.
+        Is taken from the constructor if provided, such as the boxes returned
+        by OpenCV's MSER `detectRegions()` method, else calculated from
+        `coords`.
+
+    packed_mask : 2-D array of uint8
+        Binary mask of this region, cropped to `box`, with each row bit-packed
+        by NumPy's `packbits()` method, in little-endian bit order.
+        Is calculated as needed, and then cached.
+
+    bitmask : list of int
+        Rows of `packed_mask` as arbitrary precision integers, with bit `j` of
+        row `i` set if the point `(box.x + j, box.y + i)` is in this region.
+        Is calculated as needed, and then cached.
+
+    mask : 2-D array of bool
+        Binary mask of this region, cropped to `box`, unpacked from
+        `packed_mask`.
+
+    cache : dict of (X, Y), where X is a feature key, and Y its value
+        Memoized derived features of this region, such as its image, moments,
+        contours, boundary and distance field.
+        Every feature is calculated as needed, and then cached.
+        The cache is cleared whenever the points of this region are set.
+
+    points : set of (int, int)
+        Set of points that this region contains.
+        Is constructed from `mask` as needed, and then cached.
 
     boundary : set of (int, int)
         Set of points of this region which are adjacent to at least point not in
@@ -28,8 +66,16 @@ class Region:
         Calculated using OpenCV's `findContours()` method.
         Is calculated as needed, and then cached.
 
-    cached_boundary : bool
-        Flag true if the boundary points have been calculated.
+    boundary_coords : 2-D array of int
+        Array, of shape `(n, 2)`, of the points in `boundary`.
+        Is calculated as needed, and then cached.
+
+    distance_field : 2-D array of float
+        The Euclidean distance of each point in `box` to the nearest point in
+        this region, with dimensions of `box`.
+        Calculated using OpenCV's `distanceTransform()` method on the complement
+        of `mask`.
+        Is calculated as needed, and then cached.
 
     contours : list of list of (int, int)
         The set of contours calculated using OpenCV's `findContours()` method.
@@ -40,14 +86,10 @@ class Region:
         `findContours()` method.
         Is calculated as needed, and then cached.
 
-    cached_contours : bool
-        Flag true if the contours have been calculated.
-
     Methods
     -------
     area : int
-        The cardinality of `points`; that is, the number of points this region
-        contains.
+        The number of distinct points this region contains.
 
     fill : float
         The fraction of the area of the bounding box of this region that this
@@ -57,6 +99,11 @@ class Region:
         The number of interior holes this regions contains.
         Inferred from the number of contours this region has.
 
+    hole_boxes : list of Box
+        The bounding boxes of the interior holes this region contains.
+        Inferred from the contours at odd depths of `hierarchy`.
+        Is calculated as needed, and then cached.
+
     moments : dict of (string, float)
         The image moments of this region, assuming each point has a mass of 1.
         Calculated using OpenCV's `moments()` method.
@@ -71,11 +118,24 @@ class Region:
     image : 2-D array of int
         Represents this region as binary image, with dimensions of its bounding
         box, with a point in the image being white if it is in `points`.
+        Is calculated as needed, and then cached.
+
+    integral : 2-D array of int
+        The integral image of `mask`, with dimensions one greater than those of
+        its bounding box, as calculated by OpenCV's `integral()` method.
+        Is calculated as needed, and then cached.
 
     spatial_occupancy(bins_x, bins_y) : 2-D array of float
         Constructs a set of bins, symmetric about the geometric centre of `box`,
         with `bins_x` x-bins and `bins_y` y-bins, then calculates the fill of
         each bin by the region.
+        See `spatial_occupancies()`.
+
+    distances(points) : 1-D array of float
+        Calculates the minimum distance of each of `points` to any of the points
+        in this region.
+        Points inside `box` are looked up in `distance_field`, and points
+        outside of `box` are compared against `boundary_coords`.
 
     distance(point) : float
         Calculates the minimum distance of `point` to any of the points in
@@ -89,133 +149,256 @@ class Region:
         Calculates the maximum of all distances between `points` and points in
         this region.
 
+    intersection_area(region) : int
+        Calculates the cardinality of the intersection of `region` with this
+        region, by a bitwise and of the rows of their bitmasks over the
+        intersection of their boxes.
+
     overlap(region) : float
         Calculates the fractional cardinality of the intersection of `region`
         with this region, over the cardinality of `region`.
 
     contains(region) : bool
         Returns true if all points in `region` are also in this region.
+        Compares the rows of their bitmasks, stopping at the first row of
+        `region` with a point not in this region.
+
+    clear_cache() :
+        Discards all memoized derived features of this region.
 
     """
 
-    def __init__(self, points):
-        self._points = set([(p[0], p[1]) for p in points])
-        self._box = bounding_box(self.points)
+    __slots__ = ("_coords", "_box", "_cache")
+
+    def __init__(self, points, box=None):
+        self._set_coords(points, box)
 
-        self._cached_boundary = False
-        self._boundary = None
+    def _set_coords(self, points, box=None):
+        if isinstance(points, np.ndarray):
+            coords = points.reshape(-1, 2).astype(np.int32, copy=False)
+        else:
+            coords = np.array(
+                [(p[0], p[1]) for p in points], dtype=np.int32).reshape(-1, 2)
+        self._coords = coords
+        self._box = box if box is not None else bounding_box(coords)
 
-        self._cached_contours = False
-        self._contours = None
-        self._hierarchy = None
+        self.clear_cache()
+        return
+
+    def _memoize(self, key, calculate):
+        feature = key[0] if isinstance(key, tuple) else key
+        if self._cache is None:
+            self._cache = dict()
+        if key in self._cache:
+            cache_stats[(feature, "hits")] += 1
+        else:
+            cache_stats[(feature, "misses")] += 1
+            self._cache[key] = calculate()
+        return self._cache[key]
+
+    def clear_cache(self):
+        self._cache = None
+        return
 
     @property
-    def points(self):
-        return self._points
+    def coords(self):
+        return self._coords
 
     @property
     def box(self):
         return self._box
 
+    @property
+    def packed_mask(self):
+        def calculate():
+            mask = np.zeros((self.box.height, self.box.width), dtype=bool)
+            mask[self.coords[:, 1] - self.box.y,
+                 self.coords[:, 0] - self.box.x] = True
+            return np.packbits(mask, axis=1, bitorder="little")
+        return self._memoize("packed_mask", calculate)
+
+    @property
+    def mask(self):
+        return np.unpackbits(
+            self.packed_mask, axis=1, count=self.box.width,
+            bitorder="little").view(bool)
+
+    @property
+    def bitmask(self):
+        return self._memoize(
+            "bitmask",
+            lambda: [int.from_bytes(row.tobytes(), "little")
+                     for row in self.packed_mask])
+
+    @property
+    def points(self):
+        def calculate():
+            ys, xs = np.nonzero(self.mask)
+            return set(
+                zip((xs + self.box.x).tolist(), (ys + self.box.y).tolist()))
+        return self._memoize("points", calculate)
+
     @property
     def area(self):
-        return len(self.points)
+        return self._memoize("area", lambda: np.count_nonzero(self.mask))
 
     @property
     def fill(self):
         return (self.area / self.box.area)
 
     @property
-    def boundary(self):
-        if not self._cached_boundary:
+    def boundary_coords(self):
+        def calculate():
             cs = [np.reshape(c, (-1, 2)) for c in (self.contours[0])]
-            self._boundary = set(
-                [(self.box.x + p[0], self.box.y + p[1])
-                 for p in np.concatenate(cs)])
-            self._cached_boundary = True
-        return self._boundary
+            return np.unique(np.concatenate(cs) + self.box.tl, axis=0)
+        return self._memoize("boundary_coords", calculate)
+
+    @property
+    def boundary(self):
+        return self._memoize(
+            "boundary",
+            lambda: set(map(tuple, self.boundary_coords.tolist())))
+
+    @property
+    def distance_field(self):
+        def calculate():
+            field = cv2.distanceTransform(
+                np.logical_not(self.mask).astype(np.uint8),
+                cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            # the precise transform is exact up to float32 precision, so the
+            # integer squared distances are recovered to give float64 values
+            return np.sqrt(np.rint(np.square(field, dtype=np.float64)))
+        return self._memoize("distance_field", calculate)
 
     @property
     def holes(self):
         return (len(self.contours[0]) - 1)
 
+    @property
+    def hole_boxes(self):
+        def calculate():
+            contours, hierarchy = self.contours
+            if hierarchy is None:
+                return []
+
+            parents = hierarchy[0][:, 3]
+            def depth(i):
+                d = 0
+                while parents[i] != -1:
+                    i = parents[i]
+                    d += 1
+                return d
+
+            boxes = []
+            for i, c in enumerate(contours):
+                if depth(i) % 2 == 1:
+                    x, y, w, h = cv2.boundingRect(c)
+                    boxes.append(Box(self.box.x + x, self.box.y + y, w, h))
+            return boxes
+        return self._memoize("hole_boxes", calculate)
+
     @property
     def moments(self):
-        return cv2.moments(self.image().astype(np.float32), binaryImage=True)
+        return self._memoize(
+            "moments",
+            lambda: cv2.moments(
+                self.image().astype(np.float32), binaryImage=True))
 
     @property
     def centroid(self):
-        m = self.moments
-        return (m["m10"] / m["m00"], m["m01"] / m["m00"])
+        def calculate():
+            m = self.moments
+            return (m["m10"] / m["m00"], m["m01"] / m["m00"])
+        return self._memoize("centroid", calculate)
 
     @property
     def hu_moments(self):
-        return cv2.HuMoments(self.moments)[:, 0]
+        return self._memoize(
+            "hu_moments", lambda: cv2.HuMoments(self.moments)[:, 0])
 
     @property
     def contours(self):
-        if not self._cached_contours:
-            _, self._contours, self._hierarchy = cv2.findContours(
+        def calculate():
+            _, contours, hierarchy = cv2.findContours(
                 self.image().astype(np.uint8),
                 cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-            self._cached_contours = True
-        return (self._contours, self._hierarchy)
+            return (contours, hierarchy)
+        return self._memoize("contours", calculate)
+
+    def integral(self):
+        return self._memoize(
+            "integral", lambda: cv2.integral(self.mask.view(np.uint8)))
 
     def image(self):
-        img = np.zeros((self.box.height, self.box.width), dtype=np.uint8)
-        for point in self.points:
-            j, i = (point[0] - self.box.x, point[1] - self.box.y)
-            img[i, j] = 255
-        return img
+        def calculate():
+            img = np.zeros((self.box.height, self.box.width), dtype=np.uint8)
+            img[self.coords[:, 1] - self.box.y,
+                self.coords[:, 0] - self.box.x] = 255
+            return img
+        return self._memoize("image", calculate)
 
     def spatial_occupancy(self, bins_x, bins_y):
-        s_x = math.ceil(self.box.width / bins_x)
-        s_y = math.ceil(self.box.height / bins_y)
-
-        c_x = math.floor((self.box.width - ((bins_x - 2) * s_x)) / 2)
-        c_y = math.floor((self.box.height - ((bins_y - 2) * s_y)) / 2)
-
-        xs = np.array(
-            [0]
-            + [(i * s_x) + c_x for i in range(0, bins_x - 1)]
-            + [self.box.width])
-        ys = np.array(
-            [0]
-            + [(i * s_y) + c_y for i in range(0, bins_y - 1)]
-            + [self.box.height])
-
-        img = self.image()
-        bins = np.zeros((bins_y, bins_x), dtype=np.float32)
-        for i in range(bins_y):
-            sl_y = slice(ys[i], ys[i+1])
-            for j in range(bins_x):
-                sl_x = slice(xs[j], xs[j+1])
-                n = (ys[i+1] - ys[i]) * (xs[j+1] - xs[j])
-                bins[i, j] = np.count_nonzero(img[sl_y, sl_x]) / n
-        return bins
+        return self._memoize(
+            ("spatial_occupancy", bins_x, bins_y),
+            lambda: np.reshape(
+                spatial_occupancies([self], bins_x, bins_y), (bins_y, bins_x)))
+
+    def distances(self, points):
+        points = np.reshape(np.asarray(points, dtype=np.int64), (-1, 2))
+        xs = points[:, 0] - self.box.x
+        ys = points[:, 1] - self.box.y
+        inside = ((0 <= xs) & (xs < self.box.width)
+                  & (0 <= ys) & (ys < self.box.height))
+
+        min_distances = np.empty(len(points), dtype=np.float64)
+        min_distances[inside] = self.distance_field[ys[inside], xs[inside]]
+        if not np.all(inside):
+            diffs = (points[~inside, np.newaxis, :]
+                     - self.boundary_coords[np.newaxis, :, :])
+            min_distances[~inside] = np.sqrt(
+                np.amin(np.sum(np.square(diffs), axis=2), axis=1))
+        return min_distances
 
     def distance(self, point):
-        if point in self.points:
-            min_distance = 0.0
-        else:
-            norm = lambda p: np.sqrt(np.abs((p[0] ** 2) + (p[1] ** 2)))
-            diff = lambda p1, p2: (p1[0] - p2[0], p1[1] - p2[1])
-
-            min_distance = np.amin(
-                [norm(diff(bp, point)) for bp in self.boundary])
-        return min_distance
+        return self.distances([point])[0]
 
     def set_distance_min(self, points):
-        return np.amin([self.distance(p) for p in points])
+        return np.amin(self.distances(list(points)))
 
     def set_distance_max(self, points):
-        return np.amax([self.distance(p) for p in points])
+        return np.amax(self.distances(list(points)))
+
+    def intersection_area(self, region):
+        x = max([self.box.x, region.box.x])
+        y = max([self.box.y, region.box.y])
+        w = min([self.box.br[0], region.box.br[0]]) - x
+        h = min([self.box.br[1], region.box.br[1]]) - y
+        if w <= 0 or h <= 0:
+            return 0
+
+        # shift the rows of each bitmask so that bit 0 is at `x`
+        s1, s2 = (x - self.box.x, x - region.box.x)
+        rows1 = self.bitmask[y - self.box.y:y - self.box.y + h]
+        rows2 = region.bitmask[y - region.box.y:y - region.box.y + h]
+        return sum([bin((r1 >> s1) & (r2 >> s2)).count("1")
+                    for r1, r2 in zip(rows1, rows2)])
 
     def overlap(self, region):
-        return len(self.points.intersection(region.points)) / len(region.points)
+        return self.intersection_area(region) / region.area
 
     def contains(self, region):
-        return np.all([(p in self.points) for p in region.points])
+        if region.area > self.area:
+            return False
+
+        # shift the rows of each bitmask so that bit 0 is at the leftmost `x`
+        x = min([self.box.x, region.box.x])
+        s1, s2 = (self.box.x - x, region.box.x - x)
+        for i, r2 in enumerate(region.bitmask):
+            i1 = region.box.y + i - self.box.y
+            r1 = self.bitmask[i1] if 0 <= i1 < self.box.height else 0
+            if (r2 << s2) & ~(r1 << s1):
+                return False
+        return True
 
     def show(self):
         cv2.imshow("region", self.image())
@@ -233,6 +416,144 @@ class Region:
         return properties
 
 
+def mser_regions(point_sets, boxes):
+    """
+    Creates a set of regions from the output of OpenCV's MSER.
+
+    Parameters
+    ----------
+    point_sets : list of 2-D array of int32
+        Point sets, as returned by MSER's `detectRegions()` method.
+    boxes : 2-D array of int32
+        Bounding boxes of `point_sets`, as returned by MSER's `detectRegions()`
+        method.
+
+    Returns
+    -------
+    regions : list of Region
+        The set of regions, which hold references to `point_sets` and are
+        otherwise constructed lazily.
+
+    """
+    regions = [Region(ps, Box(*b))
+               for ps, b in zip(point_sets, np.reshape(boxes, (-1, 4)).tolist())]
+    return regions
+
+
+def bin_edges(lengths, bins):
+    """
+    Calculate the edges of a set of bins symmetric about the centre of a length.
+
+    Parameters
+    ----------
+    lengths : 1-D array of int
+        The lengths to be binned.
+    bins : int
+        Number of bins per length.
+
+    Returns
+    -------
+    edges : 2-D array of int
+        Array, of shape `(len(lengths), bins + 1)`, of bin edges for each
+        length.
+        The inner bins have width `ceil(length / bins)` and the two outer bins
+        take up the remainder.
+
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    s = -(-lengths // bins)
+    c = (lengths - (bins - 2) * s) // 2
+
+    edges = np.zeros((len(lengths), bins + 1), dtype=np.int64)
+    edges[:, 1:bins] = c[:, np.newaxis] + np.arange(bins - 1) * s[:, np.newaxis]
+    edges[:, bins] = lengths
+    return edges
+
+
+def spatial_occupancies(regions, bins_x, bins_y):
+    """
+    Calculate the spatial occupancy features of a collection of regions.
+
+    Every region is binned, symmetric about the geometric centre of its box,
+    with `bins_x` x-bins and `bins_y` y-bins, and the fill of each bin by the
+    region is read from the integral image of the region.
+    The integral images of all regions are concatenated, so that every bin of
+    every region is summed in a single vectorised gather.
+
+    Parameters
+    ----------
+    regions : list of Region
+    bins_x : int
+        Number of x-component bins.
+    bins_y : int
+        Number of y-component bins.
+
+    Returns
+    -------
+    features : 2-D array of float32
+        Array, of shape `(len(regions), bins_x * bins_y)`, of the fill of each
+        bin of each region, in row-major bin order.
+
+    """
+    if not regions:
+        return np.zeros((0, bins_x * bins_y), dtype=np.float32)
+
+    widths = np.array([r.box.width for r in regions], dtype=np.int64)
+    heights = np.array([r.box.height for r in regions], dtype=np.int64)
+    xs = bin_edges(widths, bins_x)
+    ys = bin_edges(heights, bins_y)
+
+    # bin edges are used as slice bounds, and so are normalised as per slicing
+    def normalise(edges, lengths):
+        lengths = lengths[:, np.newaxis]
+        edges = np.where(edges < 0, edges + lengths, edges)
+        return np.clip(edges, 0, lengths)
+
+    lo_x = normalise(xs[:, :-1], widths)
+    hi_x = np.maximum(normalise(xs[:, 1:], widths), lo_x)
+    lo_y = normalise(ys[:, :-1], heights)
+    hi_y = np.maximum(normalise(ys[:, 1:], heights), lo_y)
+
+    integrals = [r.integral() for r in regions]
+    offsets = np.cumsum([0] + [ii.size for ii in integrals[:-1]])
+    integral = np.concatenate([np.ravel(ii) for ii in integrals])
+
+    stride = (widths + 1)[:, np.newaxis, np.newaxis]
+    offsets = offsets[:, np.newaxis, np.newaxis]
+    def at(ys, xs):
+        return integral[offsets + ys[:, :, np.newaxis] * stride
+                        + xs[:, np.newaxis, :]]
+
+    counts = (at(hi_y, hi_x) - at(lo_y, hi_x)
+              - at(hi_y, lo_x) + at(lo_y, lo_x))
+    areas = (np.diff(ys, axis=1)[:, :, np.newaxis]
+             * np.diff(xs, axis=1)[:, np.newaxis, :])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        features = (counts / areas).astype(np.float32)
+    return np.reshape(features, (len(regions), bins_x * bins_y))
+
+
+def cache_summary():
+    """
+    Summarise the hits and misses of the derived feature caches of all regions.
+
+    Returns
+    -------
+    summary : string
+        The hits and misses of each cached feature, and their totals.
+
+    """
+    features = sorted({f for f, _ in cache_stats})
+    hits = sum([cache_stats[(f, "hits")] for f in features])
+    misses = sum([cache_stats[(f, "misses")] for f in features])
+    summary = ", ".join(
+        [f"{f} {cache_stats[(f, 'hits')]}/{cache_stats[(f, 'misses')]}"
+         for f in features]
+        + [f"total {hits}/{misses} (hits/misses)"])
+    return summary
+
+
 def remove_overlapping(regions, max_overlap=0.8):
     """
     Filters regions by removing sufficiently overlapping smaller regions.
@@ -248,18 +569,26 @@ def remove_overlapping(regions, max_overlap=0.8):
     -------
     regions_filtered : iterable collection of Region
 
+    Notes
+    -----
+    Only the retained regions whose boxes are supersets of the box of a region
+    can remove it, and so these candidates are found through a `BoxIndex`
+    rather than by comparing against every retained region.
+
     """
     regions_ordered = sorted(regions, key=lambda r: r.area, reverse=True)
     regions_filtered = []
+    index = BoxIndex()
     for r in regions_ordered:
-        if np.all([not (rf.box.is_superset_of(r.box)
-                        and rf.overlap(r) >= max_overlap)
-                   for rf in regions_filtered]):
+        if not any(regions_filtered[k].overlap(r) >= max_overlap
+                   for k in index.supersets_of(r.box)):
             regions_filtered.append(r)
+            index.insert(r.box)
     return regions_filtered
 
 
-def remove_occluded_holes(regions, max_boundary_distance=10):
+def remove_occluded_holes(regions, max_boundary_distance=10,
+                          hierarchy=False):
     """
     Filters interior hole regions, which fill up another regions hole.
 
@@ -269,6 +598,13 @@ def remove_occluded_holes(regions, max_boundary_distance=10):
     max_boundary_distance : int, default=10
         Remove any region with boundary points which are never more than this
         distance away from another region which contains this one.
+    hierarchy : bool, default=False
+        Enabling this results in only the regions inside the holes of another
+        region, as given by their contour hierarchy, being considered as
+        occluded by that region.
+        Regions inside an open concavity, rather than a closed hole, of another
+        region are then retained.
+        See `hole_children()`.
 
     Returns
     -------
@@ -276,16 +612,89 @@ def remove_occluded_holes(regions, max_boundary_distance=10):
 
     """
     regions_ordered = sorted(regions, key=lambda r: r.box.x)
+
+    def occludes(rf, r):
+        return np.all(rf.distances(r.boundary_coords) <= max_boundary_distance)
+
+    if hierarchy:
+        return remove_occluded_children(
+            regions_ordered, hole_children(regions_ordered), occludes)
+
     regions_filtered = []
     for r in regions_ordered:
-        occludes = lambda rf: np.all(
-            [rf.distance(bp) <= max_boundary_distance for bp in r.boundary])
-        if np.all([not (rf.box.is_superset_of(r.box) and occludes(rf))
-                   for rf in regions_filtered]):
+        if not any(rf.box.is_superset_of(r.box) and occludes(rf, r)
+                   for rf in regions_filtered):
             regions_filtered.append(r)
     return regions_filtered
 
 
+def hole_children(regions):
+    """
+    Find the regions which lie inside the holes of each region.
+
+    The holes of each region are read from its contour hierarchy, and the
+    regions whose boxes lie inside each hole are found through a `BoxIndex`,
+    so that only nested pairs of regions are ever compared.
+
+    Parameters
+    ----------
+    regions : list of Region
+
+    Returns
+    -------
+    children : dict of (int, list of int)
+        Map between the index of each region, and the sorted indexes of the
+        regions whose boxes lie inside one of its holes.
+
+    """
+    index = BoxIndex([r.box for r in regions])
+    children = dict()
+    for i, r in enumerate(regions):
+        children[i] = sorted(
+            {j for hole in r.hole_boxes for j in index.intersecting(hole)
+             if hole.is_superset_of(regions[j].box)})
+    return children
+
+
+def remove_occluded_children(regions, children, occludes):
+    """
+    Filters regions by walking a containment tree from parents to children.
+
+    Parents are visited before their children, by walking the regions in order
+    of decreasing box area, and a region is removed if any of its retained
+    parents occludes it.
+
+    Parameters
+    ----------
+    regions : list of Region
+    children : dict of (int, list of int)
+        Map between the index of each region, and the indexes of its children.
+    occludes : function of (Region, Region) to bool
+        Returns true if the first (parent) region occludes the second (child)
+        region.
+
+    Returns
+    -------
+    regions_filtered : list of Region
+        The retained regions, in the order of `regions`.
+
+    """
+    parents = {j: [] for j in range(len(regions))}
+    for i in children:
+        for j in children[i]:
+            parents[j].append(i)
+
+    removed = set()
+    walk = sorted(range(len(regions)), key=lambda j: -regions[j].box.area)
+    for j in walk:
+        if any(i not in removed and occludes(regions[i], regions[j])
+               for i in parents[j]):
+            removed.add(j)
+
+    regions_filtered = [r for j, r in enumerate(regions) if j not in removed]
+    return regions_filtered
+
+
 def draw_regions(regions, size=None):
     """
     Creates an image from a set of regions.
@@ -303,30 +712,78 @@ def draw_regions(regions, size=None):
         black background, distinct colours for each region, and with the
         boundaries of regions coloured white.
 
+    Notes
+    -----
+    The regions are scattered into a single label image, which is coloured by
+    a lookup table, and the boundaries are found from a morphological gradient
+    of the label image, so that no boundaries of regions are calculated.
+
     """
     if size:
         canvas = Box(0, 0, size[1], size[0])
     else:
         canvas = covering_box([r.box for r in regions])
 
-    img_regions = np.zeros(
-        (canvas.height, canvas.width, 3), dtype=np.uint8)
-    for r in regions:
-        color = (random.randint(0, 179), 255, 255)
-        for p in r.points:
-            x, y = p
-            img_regions[y - canvas.y, x - canvas.x] = color
-        for bp in r.boundary:
-            x, y = bp
-            img_regions[y - canvas.y, x - canvas.x] = (0, 0, 255)
+    regions = list(regions)
+    if not regions:
+        return np.zeros((canvas.height, canvas.width, 3), dtype=np.uint8)
+
+    # label image, with later regions drawn over earlier regions
+    coords = np.concatenate([r.coords for r in regions])
+    ids = np.repeat(np.arange(1, len(regions) + 1, dtype=np.float32),
+                    [len(r.coords) for r in regions])
+    labels = np.zeros((canvas.height, canvas.width), dtype=np.float32)
+    labels[coords[:, 1] - canvas.y, coords[:, 0] - canvas.x] = ids
+
+    # boundary points have a 4-adjacent point of another label, or background
+    kernel = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+    boundary = (labels > 0) & (
+        (cv2.erode(labels, kernel, borderType=cv2.BORDER_CONSTANT,
+                   borderValue=0) != labels)
+        | (cv2.dilate(labels, kernel) != labels))
+
+    colors = np.zeros((len(regions) + 1, 3), dtype=np.uint8)
+    colors[1:] = [(random.randint(0, 179), 255, 255) for r in regions]
+    img_regions = colors[labels.astype(np.int32)]
+    img_regions[boundary] = (0, 0, 255)
     img_regions = cv2.cvtColor(img_regions, cv2.COLOR_HSV2BGR)
     return img_regions
 
 
+def cc_components(img_bin):
+    """
+    Calculate the connected components of a binary image, and their statistics.
+
+    Parameters
+    ----------
+    img_bin : 2-D array of int
+        Binary image.
+
+    Returns
+    -------
+    labels : 2-D array of int32
+        Label image, with the background labelled 0 and the components labelled
+        from 1, in raster order of their first point.
+    areas : 1-D array of int32
+        Area of each component, in order of label.
+    boxes : list of Box
+        Bounding box of each component, in order of label.
+
+    """
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(
+        img_bin, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    boxes = [Box(*s) for s in stats[1:, :4].tolist()]
+    return labels, areas, boxes
+
+
 def cc_regions(img_bin):
     """
     Creates a set of regions from the connected components of a binary image.
 
+    The points of all components are grouped by label with a single stable
+    sort, rather than by a pass over the image per component.
+
     Parameters
     ----------
     img_bin : 2-D array of int
@@ -338,7 +795,105 @@ def cc_regions(img_bin):
         The set of regions formed from connected components of a binary image.
 
     """
-    n, labels = cv2.connectedComponents(img_bin, connectivity=8)
-    regions = [Region(np.argwhere(np.transpose(labels) == l))
-               for l in range(1, n)]
+    labels, areas, boxes = cc_components(img_bin)
+
+    ys, xs = np.nonzero(labels)
+    order = np.argsort(labels[ys, xs], kind="stable")
+    coords = np.stack([xs[order], ys[order]], axis=1).astype(np.int32)
+
+    regions = [Region(c, b)
+               for c, b in zip(np.split(coords, np.cumsum(areas)[:-1]), boxes)]
+    return regions
+
+
+def cc_largest_region(img_bin):
+    """
+    Creates a region from the largest connected component of a binary image.
+
+    Parameters
+    ----------
+    img_bin : 2-D array of int
+        Binary image.
+
+    Returns
+    -------
+    region : Region, or None
+        The region formed from the largest connected component, being the first
+        in raster order if there are several, or None if there are no connected
+        components.
+
+    """
+    labels, areas, boxes = cc_components(img_bin)
+    if len(areas) == 0:
+        return None
+
+    k = np.argmax(areas)
+    ys, xs = np.nonzero(labels == k + 1)
+    region = Region(np.stack([xs, ys], axis=1).astype(np.int32), boxes[k])
+    return region
+
+
+def cc_largest_regions(imgs_bin, offsets=None):
+    """
+    Creates a region from the largest connected component of each of a set of
+    binary images.
+
+    The images are stacked into a single mosaic, each separated from the next
+    by at least one empty row, so that the connected components of all images
+    are calculated at once.
+    Each image starts on an even row, as OpenCV labels components in order of
+    the 2x2 blocks of the image, so that the components of each image are
+    labelled in the same order as they would be alone.
+    The largest component of each image is found from the component areas, and
+    only its points are extracted.
+
+    Parameters
+    ----------
+    imgs_bin : list of 2-D array of int
+        Binary images.
+    offsets : list of (int, int), default=None
+        Offset `(x, y)` of each image, by which the points of its region are
+        translated; such as the top-left corner of the box of a larger image
+        from which it was taken.
+
+    Returns
+    -------
+    regions : list of Region, or None
+        The region formed from the largest connected component of each image,
+        as per `cc_largest_region()`, or None for an image with no connected
+        components.
+
+    """
+    if offsets is None:
+        offsets = [(0, 0)] * len(imgs_bin)
+    if not imgs_bin:
+        return []
+
+    heights = [img.shape[0] for img in imgs_bin]
+    rows = np.cumsum([0] + [h + 1 + (h + 1) % 2 for h in heights]).tolist()
+    mosaic = np.zeros(
+        (rows[-1], max([img.shape[1] for img in imgs_bin] + [1])),
+        dtype=np.uint8)
+    for img, row in zip(imgs_bin, rows[:-1]):
+        mosaic[row:row + img.shape[0], 0:img.shape[1]] = img
+
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(
+        mosaic, connectivity=8)
+
+    # components are labelled in raster order, and so grouped by image
+    firsts = (np.searchsorted(stats[1:, cv2.CC_STAT_TOP], rows) + 1).tolist()
+
+    regions = []
+    for k, (dx, dy) in enumerate(offsets):
+        first, last = firsts[k], firsts[k+1]
+        if first == last:
+            regions.append(None)
+            continue
+
+        label = first + int(np.argmax(stats[first:last, cv2.CC_STAT_AREA]))
+        x, y, w, h = stats[label, :4].tolist()
+        ys, xs = np.nonzero(labels[y:y + h, x:x + w] == label)
+        coords = np.stack([xs + (x + dx), ys + (y - rows[k] + dy)], axis=1)
+        regions.append(Region(coords.astype(np.int32),
+                              Box(x + dx, y - rows[k] + dy, w, h)))
     return regions
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 
-import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import cv2
 
 from region import *
+from template import *
 
 
 class SVM_OVO:
-    def __init__(self, samples_labelled):
+    def __init__(self, samples_labelled, workers=1, c_grid=None):
+        self._workers = workers
+        self._c_grid = c_grid
         self.train(samples_labelled)
         return
 
@@ -20,13 +23,21 @@ class SVM_OVO:
     def svms(self):
         return self._svms
 
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def c_grid(self):
+        return self._c_grid
+
     def train(self, samples_labelled):
         self._labels = {k : l for k, l in enumerate(samples_labelled.keys())}
 
-        self._svms = dict()
+        pairs = dict()
 
         for ki in self.labels:
-            si = samples_labelled[ki].astype(np.float32)
+            si = samples_labelled[self.labels[ki]].astype(np.float32)
             ni = si.shape[0]
             ri = np.array([ki for i in range(ni)], dtype=np.int32)
 
@@ -34,7 +45,7 @@ class SVM_OVO:
                 if kj <= ki:
                     continue
 
-                sj = samples_labelled[kj].astype(np.float32)
+                sj = samples_labelled[self.labels[kj]].astype(np.float32)
                 nj = sj.shape[0]
                 rj = np.array([kj for j in range(nj)], dtype=np.int32)
 
@@ -45,19 +56,22 @@ class SVM_OVO:
                 wj = nij / (2 * nj)
                 wij = np.array([wi, wj])
 
-                self._svms[kij] = cv2.ml.SVM_create()
-                self._svms[kij].setType(cv2.ml.SVM_C_SVC)
-                # self._svms[kij].setKernel(cv2.ml.SVM_RBF)
-                self._svms[kij].setKernel(cv2.ml.SVM_LINEAR)
-                self._svms[kij].setTermCriteria(
-                    (cv2.TERM_CRITERIA_MAX_ITER , 100000, 1.0e-6))
-                self._svms[kij].setClassWeights(wij)
-
                 sij = np.append(si, sj, axis=0)
                 rij = np.append(ri, rj, axis=0)
 
-                self._svms[kij].trainAuto(
-                    sij, cv2.ml.ROW_SAMPLE, rij, kFold=min([nij, 10]))
+                pairs[kij] = (sij, rij, wij, min([nij, 10]), self.c_grid)
+
+        # each pair is trained, and its model serialized, in a worker process,
+        # unless a single worker is asked for
+        if self.workers == 1:
+            models = {kij: train_svm_pair(*pairs[kij]) for kij in pairs}
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {kij: executor.submit(train_svm_pair, *pairs[kij])
+                           for kij in pairs}
+                models = {kij: futures[kij].result() for kij in futures}
+
+        self._svms = {kij: read_svm(models[kij]) for kij in pairs}
         return
 
     def predict(self, samples):
@@ -79,65 +93,48 @@ class SVM_OVO:
         return labels_predicted
 
 
-def build_svm_digits(dir_digits, bins_x, bins_y):
-    digits = {
-        0: "Zero",
-        1: "One",
-        2: "Two",
-        3: "Three",
-        4: "Four",
-        5: "Five",
-        6: "Six",
-        7: "Seven",
-        8: "Eight",
-        9: "Nine"}
-
-    imgs = dict()
-    for d in iter(digits):
-        for k in range(5):
-            digit_file = os.path.join(dir_digits, f"{digits[d]}{k+1}.jpg")
-            imgs[(d, k)] = cv2.imread(digit_file, cv2.IMREAD_COLOR)
-
-    samples = dict()
-    for d in iter(digits):
-        samples[d] = np.zeros((5, bins_x * bins_y), dtype=np.float32)
-        for k in range(5):
-            img_gray = cv2.cvtColor(imgs[(d, k)], cv2.COLOR_BGR2GRAY)
-            _, img_bin = cv2.threshold(img_gray, 128, 255, cv2.THRESH_OTSU)
-
-            regions = cc_regions(img_bin)
-            h, w = img_bin.shape[:2]
-            region = min(
-                regions, key=lambda r: r.distance((int(w/2), int(h/2))))
-
-            samples[d][k] = np.ravel(region.spatial_occupancy(bins_x, bins_y))
-
-    return SVM_OVO(samples)
-
-
-def build_svm_arrows(dir_arrows, bins_x, bins_y):
-    arrows = {
-        "L": "LeftArrow",
-        "R": "RightArrow"}
-
-    imgs = dict()
-    for a in iter(arrows):
-        for k in range(5):
-            arrow_file = os.path.join(dir_arrows, f"{arrows[a]}{k+1}.jpg")
-            imgs[(a, k)] = cv2.imread(arrow_file, cv2.IMREAD_COLOR)
-
-    samples = dict()
-    for a in iter(arrows):
-        samples[a] = np.zeros((5, bins_x * bins_y), dtype=np.float32)
-        for k in range(5):
-            img_gray = cv2.cvtColor(imgs[(a, k)], cv2.COLOR_BGR2GRAY)
-            _, img_bin = cv2.threshold(img_gray, 128, 255, cv2.THRESH_OTSU)
-
-            regions = cc_regions(img_bin)
-            h, w = img_bin.shape[:2]
-            region = min(
-                regions, key=lambda r: r.distance((int(w/2), int(h/2))))
-
-            samples[d][k] = np.ravel(region.spatial_occupancy(bins_x, bins_y))
-
-    return SVM_OVO(samples)
+def train_svm_pair(samples, responses, weights, k_fold, c_grid=None):
+    # the RNG of `trainAuto()` is seeded per pair, so that the folds do not
+    # depend on which pairs were trained before in the same process
+    cv2.setRNGSeed(0)
+
+    svm = cv2.ml.SVM_create()
+    svm.setType(cv2.ml.SVM_C_SVC)
+    # svm.setKernel(cv2.ml.SVM_RBF)
+    svm.setKernel(cv2.ml.SVM_LINEAR)
+    svm.setTermCriteria((cv2.TERM_CRITERIA_MAX_ITER , 100000, 1.0e-6))
+    svm.setClassWeights(weights)
+
+    # a linear kernel only searches the grid of C, of (min, max, log step)
+    if c_grid is None:
+        svm.trainAuto(samples, cv2.ml.ROW_SAMPLE, responses, kFold=k_fold)
+    else:
+        svm.trainAuto(samples, cv2.ml.ROW_SAMPLE, responses, kFold=k_fold,
+                      Cgrid=cv2.ml.ParamGrid_create(*c_grid))
+
+    fs = cv2.FileStorage(
+        "", cv2.FILE_STORAGE_WRITE | cv2.FILE_STORAGE_MEMORY)
+    svm.write(fs)
+    return fs.releaseAndGetString()
+
+
+def read_svm(model):
+    fs = cv2.FileStorage(
+        model, cv2.FILE_STORAGE_READ | cv2.FILE_STORAGE_MEMORY)
+    svm = cv2.ml.SVM_create()
+    svm.read(fs.root())
+    return svm
+
+
+def build_svm_digits(dir_digits, bins_x, bins_y, cache_file=None,
+                     workers=None, svm_workers=1, c_grid=None):
+    samples = load_templates(dir_digits, template_names_digits, bins_x, bins_y,
+                             cache_file, workers)
+    return SVM_OVO(samples, svm_workers, c_grid)
+
+
+def build_svm_arrows(dir_arrows, bins_x, bins_y, cache_file=None,
+                     workers=None, svm_workers=1, c_grid=None):
+    samples = load_templates(dir_arrows, template_names_arrows, bins_x, bins_y,
+                             cache_file, workers)
+    return SVM_OVO(samples, svm_workers, c_grid)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import os
 import numpy as np
 import cv2
 from timeit import default_timer as timer
@@ -8,14 +9,30 @@ from parser import *
 from region import *
 from chain import *
 from knn import *
+from pipeline import *
 
 
 # task 1
 args, img_files = parse_input()
 
-# build classifier
+# build classifier, reusing the cached template features of previous runs
+templates_cache = os.path.join(args["work"], "templates.pickle")
 print(f"> building classifier")
-knn_digits = build_knn_digits(args["digits"], 5, 7)
+knn_digits = build_knn_digits(
+    args["digits"], 5, 7, cache_file=templates_cache)
+
+# filter the regions of each image, lazily where no stage needs all of them
+region_stages = Pipeline([
+    Stage("2_1", "removing overlapping regions",
+          lambda rs: remove_overlapping(rs, max_overlap=0.8), batch=True),
+    # 0.8 for directions, 1.2 for digits
+    Stage("2_2", "filtering regions by aspect ratio",
+          lambda r: 1.2 <= r.box.aspect <= 3.0),
+    Stage("2_3", "removing occluded hole regions",
+          lambda rs: remove_occluded_holes(rs, max_boundary_distance=10),
+          batch=True),
+    Stage("2_4", "removing highly filled regions",
+          lambda r: r.fill <= 0.85)])
 
 # locate and classify the digits of each building sign
 for img_file in img_files:
@@ -56,45 +73,28 @@ for img_file in img_files:
     point_sets, boxes = mser.detectRegions(img_gray)
 
     print(f"{timing()} constructing regions")
-    regions = [Region(ps) for ps in point_sets]
+    regions = mser_regions(point_sets, boxes)
 
     if args["work_save"]:
         print(f"{timing()} writing regions ({len(regions)})")
         write_image_to_work("2_0", draw_regions(regions, (H, W)))
 
-    print(f"{timing()} removing overlapping regions")
-    regions = remove_overlapping(regions, max_overlap=0.8)
-
-    if args["work_save"]:
-        print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_1", draw_regions(regions, (H, W)))
-
-    print(f"{timing()} filtering regions by aspect ratio")
-    # 0.8 for directions, 1.2 for digits
-    regions = list(filter(lambda r: 1.2 <= r.box.aspect <= 3.0, regions))
-
-    if args["work_save"]:
-        print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_2", draw_regions(regions, (H, W)))
-
-    print(f"{timing()} removing occluded hole regions")
-    regions = remove_occluded_holes(regions, max_boundary_distance=10)
-
-    if args["work_save"]:
+    def capture_regions(stage, regions):
         print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_3", draw_regions(regions, (H, W)))
-
-    print(f"{timing()} removing highly filled regions")
-    regions = list(filter(lambda r: r.fill <= 0.85, regions))
+        write_image_to_work(stage.name, draw_regions(regions, (H, W)))
+        return
 
-    if args["work_save"]:
-        print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_4", draw_regions(regions, (H, W)))
+    regions = region_stages.run(
+        regions,
+        log=lambda stage: print(f"{timing()} {stage.description}"),
+        capture=capture_regions if args["work_save"] else None)
+    regions = list(regions)
 
     print(f"{timing()} calculating chains of similar, adjacent regions")
-    chains = find_chains(regions)
+    chains = iter_chains(regions)
 
     if args["work_save"]:
+        chains = list(chains)
         print(f"{timing()} writing chains ({len(chains)})")
         img_chains = draw_regions(regions, (H, W))
         for chain in chains:
@@ -104,7 +104,7 @@ for img_file in img_files:
         write_image_to_work("3", img_chains)
 
     print(f"{timing()} filtering chains by length")
-    chains = list(filter(lambda c: len(c) <= 3, chains))
+    chains = [c for c in chains if len(c) <= 3]
 
     if not chains:
         print(f"{timing()} no suitable chains found")
@@ -126,7 +126,8 @@ for img_file in img_files:
             write_image_to_work(f"4_{i}", img_roi)
 
     print(f"{timing()} selecting chain most likely to be digits")
-    chain_digits = cluster_largest_otsu_separations(img, chains)[0]
+    chain_digits = cluster_largest_otsu_separations(
+        img, chains, img_gray=img_gray)[0]
 
     if args["work_save"]:
         print(f"{timing()} writing digit chain")
@@ -134,9 +135,7 @@ for img_file in img_files:
         write_image_to_work("5", img_digits)
 
     print(f"{timing()} classifying digits")
-    features_digits = np.array(
-        [np.ravel(r.spatial_occupancy(5, 7))
-         for r in chain_digits])
+    features_digits = spatial_occupancies(chain_digits, 5, 7)
     predicted_digits = knn_digits.predict(features_digits, k=3)
 
     print(f"{timing()} writing output for {file_root}{file_ext}")
@@ -148,3 +147,6 @@ for img_file in img_files:
         print(f"Building {str_digits}", file=out_file)
 
     print(f"{timing()} ")
+
+# report the use of the region feature caches
+print(f"> region cache: {cache_summary()}")
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import os
 import numpy as np
 import cv2
 from timeit import default_timer as timer
@@ -8,15 +9,31 @@ from parser import *
 from region import *
 from chain import *
 from knn import *
+from pipeline import *
 
 
 # task 2
 args, img_files = parse_input()
 
-# build classifiers
+# build classifiers, reusing the cached template features of previous runs
+templates_cache = os.path.join(args["work"], "templates.pickle")
 print(f"> building classifiers")
-knn_digits = build_knn_digits(args["digits"], 3, 5)
-knn_arrows = build_knn_arrows(args["digits"], 2, 2)
+knn_digits = build_knn_digits(
+    args["digits"], 3, 5, cache_file=templates_cache)
+knn_arrows = build_knn_arrows(
+    args["digits"], 2, 2, cache_file=templates_cache)
+
+# filter the regions of each image, lazily where no stage needs all of them
+region_stages = Pipeline([
+    Stage("2_1", "removing overlapping regions",
+          lambda rs: remove_overlapping(rs, max_overlap=0.8), batch=True),
+    Stage("2_2", "filtering regions by aspect ratio",
+          lambda r: 0.75 <= r.box.aspect <= 3.0),
+    Stage("2_3", "removing occluded hole regions",
+          lambda rs: remove_occluded_holes(rs, max_boundary_distance=10),
+          batch=True),
+    Stage("2_4", "removing highly filled regions",
+          lambda r: r.fill <= 0.85)])
 
 # locate and classify the digits of each line of each directional sign
 for img_file in img_files:
@@ -57,44 +74,28 @@ for img_file in img_files:
     point_sets, boxes = mser.detectRegions(img_gray)
 
     print(f"{timing()} constructing regions")
-    regions = [Region(ps) for ps in point_sets]
+    regions = mser_regions(point_sets, boxes)
 
     if args["work_save"]:
         print(f"{timing()} writing regions ({len(regions)})")
         write_image_to_work("2_0", draw_regions(regions, (H, W)))
 
-    print(f"{timing()} removing overlapping regions")
-    regions = remove_overlapping(regions, max_overlap=0.8)
-
-    if args["work_save"]:
+    def capture_regions(stage, regions):
         print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_1", draw_regions(regions, (H, W)))
-
-    print(f"{timing()} filtering regions by aspect ratio")
-    regions = list(filter(lambda r: 0.75 <= r.box.aspect <= 3.0, regions))
-
-    if args["work_save"]:
-        print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_2", draw_regions(regions, (H, W)))
-
-    print(f"{timing()} removing occluded hole regions")
-    regions = remove_occluded_holes(regions, max_boundary_distance=10)
-
-    if args["work_save"]:
-        print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_3", draw_regions(regions, (H, W)))
-
-    print(f"{timing()} removing highly filled regions")
-    regions = list(filter(lambda r: r.fill <= 0.85, regions))
+        write_image_to_work(stage.name, draw_regions(regions, (H, W)))
+        return
 
-    if args["work_save"]:
-        print(f"{timing()} writing regions ({len(regions)})")
-        write_image_to_work("2_4", draw_regions(regions, (H, W)))
+    regions = region_stages.run(
+        regions,
+        log=lambda stage: print(f"{timing()} {stage.description}"),
+        capture=capture_regions if args["work_save"] else None)
+    regions = list(regions)
 
     print(f"{timing()} finding chains of similar, adjacent regions")
-    chains = find_chains(regions)
+    chains = iter_chains(regions)
 
     if args["work_save"]:
+        chains = list(chains)
         print(f"{timing()} writing chains ({len(chains)})")
         img_chains = draw_regions(regions, (H, W))
         for chain in chains:
@@ -104,7 +105,7 @@ for img_file in img_files:
         write_image_to_work("3", img_chains)
 
     print(f"{timing()} filtering chains by length")
-    chains = list(filter(lambda c: len(c) <= 3, chains))
+    chains = [c for c in chains if len(c) <= 3]
 
     if not chains:
         print(f"{timing()} no suitable chains found")
@@ -180,17 +181,13 @@ for img_file in img_files:
             write_image_to_work(f"7_{i}", draw_regions(c + [a]))
 
     print(f"{timing()} classifying digits and arrows")
-    predicted = []
-    for chain_digits, arrow in aligned_chains_arrows:
-
-        features_digits = np.array(
-            [np.ravel(r.spatial_occupancy(3, 5))
-             for r in chain_digits])
-        predicted_digits = knn_digits.predict(features_digits, k=3)
-
-        features_arrow = np.array([np.ravel(arrow.spatial_occupancy(2, 2))])
-        predicted_arrow = knn_arrows.predict(features_arrow, k=3)
-        predicted.append((predicted_digits, predicted_arrow))
+    features_digits = [spatial_occupancies(c, 3, 5)
+                       for c, _ in aligned_chains_arrows]
+    features_arrows = spatial_occupancies(
+        [a for _, a in aligned_chains_arrows], 2, 2)
+    predicted = list(zip(
+        knn_digits.predict_sets(features_digits, k=3),
+        knn_arrows.predict(features_arrows, k=3)))
 
     print(f"{timing()} writing output for {file_root}{file_ext}")
     aca_box = covering_box(
@@ -202,7 +199,7 @@ for img_file in img_files:
     with open(f"{args['output']}/BuildingList{file_id}.txt", "w") as out_file:
         for ds, a in predicted:
             str_digits = "".join(map(str, ds))
-            if a[0] == "L":
+            if a == "L":
                 str_arrow = "to the left"
             else:
                 str_arrow = "to the right"
@@ -210,3 +207,6 @@ for img_file in img_files:
             print(f"Building {str_digits} {str_arrow}", file=out_file)
 
     print(f"{timing()} ")
+
+# report the use of the region feature caches
+print(f"> region cache: {cache_summary()}")
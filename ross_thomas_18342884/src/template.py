@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from region import *
+
+
+template_names_digits = {
+    0: "Zero",
+    1: "One",
+    2: "Two",
+    3: "Three",
+    4: "Four",
+    5: "Five",
+    6: "Six",
+    7: "Seven",
+    8: "Eight",
+    9: "Nine"}
+
+template_names_arrows = {
+    "L": "LeftArrow",
+    "R": "RightArrow"}
+
+
+def template_files(dir_templates, names):
+    """
+    Discover the template images of each label in a directory.
+
+    The template images of a label are named after the label's name, followed
+    by a number, such as `Zero1.jpg`, `Zero2.png`, ..., and any number of them
+    may be provided.
+
+    Parameters
+    ----------
+    dir_templates : string
+        Path for the directory containing the template images.
+    names : dict of (X, string), where X is the type of label
+        Name of the template images of each label.
+
+    Returns
+    -------
+    files : dict of (X, list of string)
+        Paths for the template images of each label, in order of their number.
+
+    """
+    patterns = {l: re.compile(rf"{re.escape(n)}(\d+)\.(jpg|png)")
+                for l, n in names.items()}
+
+    numbered = {l: [] for l in names}
+    for f in sorted(os.listdir(dir_templates)):
+        for l, pattern in patterns.items():
+            match = pattern.fullmatch(f)
+            if match:
+                numbered[l].append(
+                    (int(match.group(1)), os.path.join(dir_templates, f)))
+
+    return {l: [f for _, f in sorted(numbered[l])] for l in names}
+
+
+def template_region(template_file):
+    """
+    Extract the region of a template image, as the connected component of its
+    Otsu thresholded image nearest to the centre of the image.
+
+    Parameters
+    ----------
+    template_file : string
+        Path for the template image.
+
+    Returns
+    -------
+    Region
+
+    """
+    img = cv2.imread(template_file, cv2.IMREAD_COLOR)
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, img_bin = cv2.threshold(img_gray, 128, 255, cv2.THRESH_OTSU)
+
+    regions = cc_regions(img_bin)
+    h, w = img_bin.shape[:2]
+    return min(regions, key=lambda r: r.distance((int(w/2), int(h/2))))
+
+
+def load_templates(dir_templates, names, bins_x, bins_y, cache_file=None,
+                   workers=None):
+    """
+    Load the labelled training samples of a set of template images, as the
+    spatial occupancies of their regions, for any classifier backend.
+
+    The template images are decoded, and their regions extracted, in a pool of
+    threads; OpenCV releases the GIL, so this scales with the number of cores.
+
+    Parameters
+    ----------
+    dir_templates : string
+        Path for the directory containing the template images.
+    names : dict of (X, string), where X is the type of label
+        Name of the template images of each label, as per `template_files()`.
+    bins_x : int
+        Number of x-component bins for `spatial_occupancies()`.
+    bins_y : int
+        Number of y-component bins for `spatial_occupancies()`.
+    cache_file : string, default=None
+        Path for a file in which the training samples are cached, as per
+        `cached_samples()`.
+    workers : int, default=None
+        Number of threads, or None for the number of processors.
+
+    Returns
+    -------
+    samples_labelled : dict of (X, 2-D array of float32)
+        The samples of each label, in the order of `names`.
+
+    """
+    files = template_files(dir_templates, names)
+
+    def calculate():
+        files_all = [f for l in names for f in files[l]]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            regions_all = list(executor.map(template_region, files_all))
+
+        samples = dict()
+        start = 0
+        for l in names:
+            regions_l = regions_all[start:start+len(files[l])]
+            samples[l] = spatial_occupancies(regions_l, bins_x, bins_y)
+            start += len(files[l])
+        return samples
+
+    return cached_samples(
+        cache_file, (tuple(names.items()), bins_x, bins_y),
+        [f for l in names for f in files[l]], calculate)
+
+
+def template_signature(files):
+    """
+    Construct a signature of a set of template files, which changes whenever
+    any of the files is replaced or modified.
+
+    Parameters
+    ----------
+    files : list of string
+
+    Returns
+    -------
+    tuple of (string, int, int)
+        The name, modification time (in nanoseconds), and size of each file.
+        A missing file has a modification time and size of -1.
+
+    """
+    signature = []
+    for f in files:
+        try:
+            stat = os.stat(f)
+            signature.append((os.path.basename(f), stat.st_mtime_ns,
+                              stat.st_size))
+        except OSError:
+            signature.append((os.path.basename(f), -1, -1))
+    return tuple(signature)
+
+
+def cached_samples(cache_file, key, files, calculate):
+    """
+    Load a set of labelled training samples from a cache file, or calculate
+    them and store them in the cache file.
+
+    The cache file holds a pickled dictionary, mapping each key to the
+    signature of the template files the samples were calculated from, and the
+    samples.
+    Samples are only loaded if the signature of `files` is unchanged; and the
+    cache file is replaced atomically, so that a run which is interrupted, or
+    concurrent, never leaves a partially written cache file.
+
+    Parameters
+    ----------
+    cache_file : string, or None
+        Path for the cache file, which need not exist.
+        If None, the samples are always calculated, and not cached.
+    key : tuple
+        Key of the samples, which covers every parameter the samples are
+        calculated with.
+    files : list of string
+        Template files the samples are calculated from.
+    calculate : callable
+        Function, taking no arguments, which calculates the samples.
+
+    Returns
+    -------
+    samples_labelled : dict of (X, 2-D array of float), where X is the type of
+    label of samples
+        The samples of each label.
+
+    """
+    if cache_file is None:
+        return calculate()
+
+    signature = template_signature(files)
+    try:
+        with open(cache_file, "rb") as f:
+            cache = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        cache = dict()
+
+    if key in cache and cache[key][0] == signature:
+        return cache[key][1]
+
+    samples = calculate()
+    cache[key] = (signature, samples)
+    cache_file_tmp = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(cache_file_tmp, "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file_tmp, cache_file)
+    except OSError:
+        pass
+    return samples